@@ -1,18 +1,47 @@
-import sys
-import time
+import orjson
 import logging
-from os.path import dirname, abspath
+from functools import lru_cache
 import requests
 import polars as pl
 from bs4 import BeautifulSoup
-import re
+import lxml.html
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
 from urllib.parse import urlparse, urljoin
 
-# Add the parent directory to the sys.path
-sys.path.append(dirname(dirname(abspath(__file__))))
-
-
-from utils.content import fetch_html_content
+from utils.content import (
+    HTML_CACHE_MAX_AGE,
+    fetch_html_content,
+    fetch_html_contents,
+    http_session,
+)
+from utils.redis import redis_conn
+
+# Parsed category URLs, so cold processes can skip parsing the homepage
+_CATEGORIES_KEY = "categories:urls"
+
+# Deletes every Latin-1 character that is not a decimal digit ("2.311" -> "2311")
+_DIGITS_ONLY = str.maketrans(
+    "", "", "".join(chr(c) for c in range(256) if not chr(c).isdecimal())
+)
+
+_SUPERMARKET_SCHEMA = {
+    "store_id": pl.Utf8,
+    "address": pl.Utf8,
+    "schedule": pl.Utf8,
+    "holidays": pl.Utf8,
+    "latitude": pl.Float64,
+    "longitude": pl.Float64,
+}
+
+_PRODUCT_SCHEMA = {
+    "discount-value": pl.Utf8,
+    "price": pl.Utf8,
+    "price-per-unit": pl.Utf8,
+    "name": pl.Utf8,
+    "image": pl.Utf8,
+    "url": pl.Utf8,
+}
 
 
 def fetch_supermarkets():
@@ -25,31 +54,23 @@ def fetch_supermarkets():
         "showMap": "false",
         "postalCodeInput": "España",
     }
-    session = requests.Session()
-    retries = 5
     timeout = 5
-    delay = 5
-
-    for _ in range(0, retries):
-        try:
-            logging.info("Fetching supermarkets data from Ahorramas API")
-            response = session.get(url, headers={}, params=params, timeout=timeout)
-            session.close()
-            logging.info("Supermarkets data fetched from Ahorramas API")
-            return response.json()
-
-        except requests.Timeout as exception:
-            logging.error("Timeout error: %s", exception)
-            time.sleep(delay)
-
-        except requests.RequestException as exception:
-            logging.warning("Request error: %s", exception)
-            time.sleep(delay)
-
-    logging.error(
-        "Max retries reached. Failed to fetch supermarkets data from Ahorramas API"
-    )
-    raise RuntimeError("Failed to fetch supermarkets from Ahorramas API")
+
+    try:
+        logging.info("Fetching supermarkets data from Ahorramas API")
+        response = http_session().get(url, headers={}, params=params, timeout=timeout)
+        response.raise_for_status()
+        logging.info("Supermarkets data fetched from Ahorramas API")
+        return orjson.loads(response.content)
+
+    except (requests.RequestException, orjson.JSONDecodeError) as exception:
+        logging.error(
+            "Max retries reached. Failed to fetch supermarkets data from Ahorramas API: %s",
+            exception,
+        )
+        raise RuntimeError(
+            "Failed to fetch supermarkets from Ahorramas API"
+        ) from exception
 
 
 def extract_supermarkets() -> pl.DataFrame:
@@ -65,54 +86,83 @@ def extract_supermarkets() -> pl.DataFrame:
     raw_data = fetch_supermarkets()
     raw_supermarkets = raw_data["stores"]
 
-    items = []
-
-    for supermarket in raw_supermarkets:
-        items.append(
-            {
-                "store_id": supermarket["codtda"],
-                "address": supermarket["direccion"],
-                "schedule": supermarket["horario"],
-                "holidays": supermarket["festivos"],
-                "latitude": supermarket["latitude"],
-                "longitude": supermarket["longitude"],
-            }
-        )
+    # strict=False coerces mixed API values (e.g. numeric store codes, string
+    # coordinates) to the schema types; unparseable coordinates become nulls
+    return pl.DataFrame(
+        {
+            "store_id": [supermarket["codtda"] for supermarket in raw_supermarkets],
+            "address": [supermarket["direccion"] for supermarket in raw_supermarkets],
+            "schedule": [supermarket["horario"] for supermarket in raw_supermarkets],
+            "holidays": [supermarket["festivos"] for supermarket in raw_supermarkets],
+            "latitude": [supermarket["latitude"] for supermarket in raw_supermarkets],
+            "longitude": [supermarket["longitude"] for supermarket in raw_supermarkets],
+        },
+        schema=_SUPERMARKET_SCHEMA,
+        strict=False,
+    )
+
 
-    return pl.DataFrame(items)
+def _single_string(el) -> str | None:
+    """
+    Returns the only string inside an element, or None if it has mixed content.
+
+    Mirrors BeautifulSoup's `Tag.string`: an element with a single child element
+    and no text around it yields that child's string.
+    """
+    if len(el) == 0:
+        return el.text
+    if len(el) == 1 and not el.text and not el[0].tail:
+        return _single_string(el[0])
+    return None
 
 
-def extract_categories():
+@lru_cache(maxsize=1)
+def extract_categories() -> tuple[str, ...]:
     """
-    Fetches and extracts categories and subcategories from Ahorramas main page.
+    Fetches and extracts the category URLs from the Ahorramas main page.
 
     Returns:
-    list: A list of dictionaries containing category information. Each dictionary has the following keys:
-          - "name": The full category name (e.g., "Alimentación - Frutos Secos")
-          - "url": The absolute URL of the category page
-          - "parent_category": The main category name (e.g., "Alimentación")
-          - "link_text": The text of the specific link
-
-    This function uses the BeautifulSoup library to parse the HTML content of the Ahorramas main page.
-    It extracts all category links from elements with class "menu-category-name" and returns them as a list.
+    tuple[str, ...]: The URL of every "Ver todo" category link, in page order.
+
+    The links are collected with lxml's pull parser from the HTML content of the Ahorramas main page.
+    The result is memoized for the lifetime of the process and stored in Redis under
+    'categories:urls' for HTML_CACHE_MAX_AGE seconds, so the homepage is only
+    fetched and parsed again once its cached HTML would be revalidated. A page
+    without category links is not stored, so the next run fetches it again.
     """
+    # An empty list may have been stored before empty results were skipped
+    cached = redis_conn().get(_CATEGORIES_KEY)
+    cached_urls = orjson.loads(cached) if cached else None
+    if cached_urls:
+        logging.info("Using cached category URLs")
+        return tuple(cached_urls)
+
     logging.info("Starting extraction of categories from Ahorramas")
 
     url = "https://www.ahorramas.com/"
 
     html_content = fetch_html_content(url)
-    soup = BeautifulSoup(html_content, "html.parser")
+    # Only <a> elements are needed, so read them off a pull parser as they close
+    parser = etree.HTMLPullParser(events=("end",), tag="a")
+    parser.feed(html_content)
+    parser.close()
 
-    urls = [
-        link.get("href")
-        for link in soup.find_all("a", string=lambda text: text and "Ver todo" in text)
-    ]
+    urls = []
+    for _, link in parser.read_events():
+        text = _single_string(link)
+        if text and "Ver todo" in text:
+            urls.append(link.get("href"))
 
     logging.info("Successfully extracted %d category URLs", len(urls))
-    return urls
+
+    # No links usually means a markup change or an error page; do not persist it
+    if urls:
+        redis_conn().set(_CATEGORIES_KEY, orjson.dumps(urls), ex=HTML_CACHE_MAX_AGE)
+    return tuple(urls)
 
 
-def extract_category_slugs() -> list[str]:
+@lru_cache(maxsize=1)
+def extract_category_slugs() -> tuple[str, ...]:
     """
     Extracts top-level category slugs from the category URLs returned by `extract_categories()`.
 
@@ -122,9 +172,10 @@ def extract_category_slugs() -> list[str]:
     are removed and the result is returned sorted and lowercased.
 
     Returns:
-    list[str]: Sorted list of unique top-level categories in lowercase
-               (e.g., ["frescos", "alimentacion", "bebidas", "lacteos", "limpieza",
-                       "hogar", "cuidado-personal", "congelados", "bebe", "mascotas"]).
+    tuple[str, ...]: Sorted unique top-level categories in lowercase
+                     (e.g., ("alimentacion", "bebe", "bebidas", "congelados",
+                             "cuidado-personal", "frescos", "hogar", "lacteos",
+                             "limpieza", "mascotas")).
     """
     urls = extract_categories()
 
@@ -135,9 +186,18 @@ def extract_category_slugs() -> list[str]:
         if segments:
             slugs.add(segments[0].lower())
 
-    return sorted(slugs)
+    return tuple(sorted(slugs))
 
 
+def _category_id(category_url: str) -> str:
+    """
+    Returns the category id (cgid) of a category URL, i.e. its last path segment.
+    """
+    path_parts = [p for p in urlparse(category_url).path.split("/") if p]
+    return path_parts[-1] if path_parts else ""
+
+
+@lru_cache(maxsize=128)
 def get_category_total_size(category_url: str) -> int:
     """
     Extracts the total number of products from an Ahorramas category page.
@@ -146,6 +206,10 @@ def get_category_total_size(category_url: str) -> int:
     the text "<number> Resultados" (inside '.product-results-count'), and returns
     the integer value. It supports thousands separators like '.' or spaces.
 
+    The count is memoized per process and stored in Redis under
+    'category_size:<cgid>' for HTML_CACHE_MAX_AGE seconds, so the category page
+    is not fetched and parsed again while the cached count is fresh.
+
     Parameters:
     category_url (str): The absolute URL of the Ahorramas category page
                         (e.g., "https://www.ahorramas.com/mascotas/").
@@ -153,6 +217,12 @@ def get_category_total_size(category_url: str) -> int:
     Returns:
     int: The total number of products found on the category page.
     """
+    redis_key = f"category_size:{_category_id(category_url)}"
+    cached = redis_conn().get(redis_key)
+    if cached:
+        logging.info("Using cached total size for %s", category_url)
+        return int(cached)
+
     logging.info("Fetching total size from category page: %s", category_url)
 
     html_content = fetch_html_content(category_url)
@@ -166,19 +236,78 @@ def get_category_total_size(category_url: str) -> int:
 
     # Expected format: "<number> Resultados" -> take the first token
     first_token = text.split(" ", 1)[0]
-    digits = re.sub(r"\D", "", first_token)  # normalize "2.311" -> "2311"
-    return int(digits) if digits else 0
+    digits = first_token.translate(_DIGITS_ONLY)
+    total_size = int(digits) if digits.isdecimal() else 0
+
+    # A zero usually means the counter was not found; do not persist it
+    if total_size:
+        redis_conn().set(redis_key, total_size, ex=HTML_CACHE_MAX_AGE)
+    return total_size
 
 
-def extract_products(category_url: str, pmin: float = 0.01) -> pl.DataFrame:
+def _has_class(name: str) -> str:
+    """
+    Returns an XPath predicate matching elements whose class attribute contains
+    the given class name, i.e. the XPath equivalent of the CSS selector '.name'.
+    """
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Product tile lookups, compiled once instead of on every call (CSS equivalent
+# in the comments). Paths starting with '.' are relative to the element given.
+_XP_PRODUCTS = etree.XPath(f"//div[{_has_class('product')}]")  # div.product
+_XP_TILE_BODY = etree.XPath(f".//*[{_has_class('tile-body')}]")  # .tile-body
+_XP_DISCOUNT = etree.XPath(  # .discount-value .marker
+    f".//*[{_has_class('discount-value')}]//*[{_has_class('marker')}]"
+)
+_XP_PRICE = etree.XPath(  # .price .sales .value
+    f".//*[{_has_class('price')}]//*[{_has_class('sales')}]//*[{_has_class('value')}]"
+)
+_XP_PRICE_PER_UNIT = etree.XPath(  # .unit-price-row .unit-price-per-unit
+    f".//*[{_has_class('unit-price-row')}]//*[{_has_class('unit-price-per-unit')}]"
+)
+_XP_NAME = etree.XPath(  # .pdp-link h2.link.product-name-gtm
+    f".//*[{_has_class('pdp-link')}]"
+    f"//h2[{_has_class('link')} and {_has_class('product-name-gtm')}]"
+)
+_XP_IMAGE = etree.XPath(  # .image-container img.tile-image
+    f".//*[{_has_class('image-container')}]//img[{_has_class('tile-image')}]"
+)
+_XP_LINKS = (  # .pdp-link a[href], then .image-container a[href], then a[href]
+    etree.XPath(f".//*[{_has_class('pdp-link')}]//a[@href]"),
+    etree.XPath(f".//*[{_has_class('image-container')}]//a[@href]"),
+    etree.XPath(".//a[@href]"),
+)
+
+
+def _first(el, xpath: etree.XPath):
+    """
+    Returns the first element matched by the compiled `xpath` under `el`, or None.
+    """
+    found = xpath(el)
+    return found[0] if found else None
+
+
+def _text_or_empty(el) -> str:
+    """
+    Returns the text content of an element with every text node stripped, matching
+    BeautifulSoup's get_text(strip=True), or an empty string if there is no element.
+    """
+    if el is None:
+        return ""
+    return "".join(t.strip() for t in el.itertext())
+
+
+def extract_products(
+    category_url: str, pmin: float = 0.01, chunk_size: int = 500
+) -> pl.DataFrame:
     """
     Extracts all product information from a given Ahorramas category URL.
 
     The function first fetches the category page to obtain the total number of products.
-    If the total exceeds 1000 items, the extraction is paginated in chunks of 1000 until
-    the total number of items is reached. For each request, the Search-UpdateGrid endpoint
-    is called with the appropriate 'start' and 'sz' parameters. The returned HTML fragments
-    are parsed to extract, for each product:
+    The extraction is then paginated in chunks of `chunk_size` items, and the chunks are fetched
+    concurrently from the Search-UpdateGrid endpoint with the appropriate 'start' and 'sz'
+    parameters. The returned HTML fragments are parsed in order to extract, for each product:
         - discount-value
         - price
         - price-per-unit
@@ -190,106 +319,139 @@ def extract_products(category_url: str, pmin: float = 0.01) -> pl.DataFrame:
     category_url (str): The absolute URL of the Ahorramas category page
                         (e.g., "https://www.ahorramas.com/mascotas/").
     pmin (float, optional): Minimum price filter to avoid zero-priced items. Defaults to 0.01.
+    chunk_size (int, optional): Number of products requested per grid page. Larger pages
+                                mean fewer round trips. Defaults to 500.
 
     Returns:
-    pl.DataFrame: A Polars DataFrame with one row per product and the attributes above.
+    pl.DataFrame: A Polars DataFrame with one row per product and the attributes above,
+                  with the price parsed as a Float64 and the other columns as strings.
     """
     logging.info("Starting full extraction from category URL: %s", category_url)
 
-    path_parts = [p for p in urlparse(category_url).path.split("/") if p]
-    cgid = path_parts[-1] if path_parts else ""
+    cgid = _category_id(category_url)
 
     total_size = get_category_total_size(category_url)
     logging.info("Total size detected for %s: %d", cgid, total_size)
 
     base_url = "https://www.ahorramas.com/on/demandware.store/Sites-Ahorramas-Site/es/Search-UpdateGrid"
 
-    def text_or_empty(el):
-        return el.get_text(strip=True) if el else ""
-
-    items = []
+    # One list per output column (filled in lockstep, one entry per product)
+    discount_values = []
+    prices = []
+    prices_per_unit = []
+    names = []
+    images = []
+    urls = []
 
-    CHUNK_SIZE = 100
-    remaining = total_size
-    start = 0
+    MAX_WORKERS = 8
 
-    while remaining > 0:
-        sz = CHUNK_SIZE if remaining > CHUNK_SIZE else remaining
-        params = {
+    # Every chunk is known up-front from the total size, so they can be fetched concurrently
+    params_list = [
+        {
             "cgid": cgid,
             "pmin": f"{pmin:.2f}",
             "start": str(start),
-            "sz": str(sz),
+            "sz": str(min(chunk_size, total_size - start)),
         }
+        for start in range(0, total_size, chunk_size)
+    ]
 
-        logging.info(
-            "Fetching grid chunk: cgid=%s start=%s sz=%s remaining=%s",
-            cgid,
-            params["start"],
-            params["sz"],
-            remaining,
-        )
+    logging.info(
+        "Fetching %d grid chunks for cgid=%s (chunk size %d)",
+        len(params_list),
+        cgid,
+        chunk_size,
+    )
+    html_chunks = fetch_html_contents(
+        base_url, params_list, timeout=120, max_workers=MAX_WORKERS
+    )
 
-        html_content = fetch_html_content(
-            base_url, params=params, timeout=120, retries=5
-        )
-        soup = BeautifulSoup(html_content, "html.parser")
+    # Chunks come back in submission order, so they are parsed in pagination order
+    for html_content in html_chunks:
+        root = lxml.html.fromstring(html_content) if html_content.strip() else None
+        products = _XP_PRODUCTS(root) if root is not None else []
+
+        if not products:
+            logging.warning(
+                "No products parsed in this chunk; breaking pagination early."
+            )
+            break
 
-        for prod in soup.select("div.product"):
-            tile_body = prod.select_one(".tile-body")
+        for prod in products:
+            tile_body = _first(prod, _XP_TILE_BODY)
 
             discount_el = (
-                tile_body.select_one(".discount-value .marker") if tile_body else None
+                _first(tile_body, _XP_DISCOUNT) if tile_body is not None else None
             )
-            discount_value = text_or_empty(discount_el)
+            discount_values.append(_text_or_empty(discount_el))
 
-            price_el = (
-                tile_body.select_one(".price .sales .value") if tile_body else None
-            )
-            price = text_or_empty(price_el)
+            price_el = _first(tile_body, _XP_PRICE) if tile_body is not None else None
+            prices.append(_text_or_empty(price_el))
 
             unit_el = (
-                tile_body.select_one(".unit-price-row .unit-price-per-unit")
-                if tile_body
-                else None
+                _first(tile_body, _XP_PRICE_PER_UNIT) if tile_body is not None else None
             )
-            price_per_unit = text_or_empty(unit_el)
+            prices_per_unit.append(_text_or_empty(unit_el))
 
-            name_el = prod.select_one(".pdp-link h2.link.product-name-gtm")
-            name = text_or_empty(name_el)
+            names.append(_text_or_empty(_first(prod, _XP_NAME)))
 
-            img_el = prod.select_one(".image-container img.tile-image")
-            image = img_el.get("src") if img_el else ""
+            img_el = _first(prod, _XP_IMAGE)
+            images.append(img_el.get("src", "") if img_el is not None else "")
 
             # product URL (prefer .pdp-link a[href], fallback to image/container anchors)
-            link_el = (
-                prod.select_one(".pdp-link a[href]")
-                or prod.select_one(".image-container a[href]")
-                or prod.select_one("a[href]")
-            )
-            href = link_el.get("href") if link_el else ""
-            url = urljoin("https://www.ahorramas.com", href) if href else ""
-
-            items.append(
-                {
-                    "discount-value": discount_value,
-                    "price": price,
-                    "price-per-unit": price_per_unit,
-                    "name": name,
-                    "image": image,
-                    "url": url,
-                }
+            link_el = next(
+                (el for xp in _XP_LINKS if (el := _first(prod, xp)) is not None), None
             )
+            href = link_el.get("href") if link_el is not None else ""
+            urls.append(urljoin("https://www.ahorramas.com", href) if href else "")
+
+    # Built column-wise so polars does not have to convert a dict per row
+    df = pl.DataFrame(
+        {
+            "discount-value": discount_values,
+            "price": prices,
+            "price-per-unit": prices_per_unit,
+            "name": names,
+            "image": images,
+            "url": urls,
+        },
+        schema=_PRODUCT_SCHEMA,
+    ).with_columns(
+        # "1,25€" -> 1.25 in one vectorized pass; unparseable prices become nulls
+        pl.col("price")
+        .str.replace_all(r"[^0-9,.]", "")
+        .str.replace(",", ".", literal=True)
+        .cast(pl.Float64, strict=False)
+    )
+    logging.info("Extracted %d products for cgid=%s", len(names), cgid)
+    return df
 
-        start += sz
-        remaining -= sz
 
-        if sz == 0 or (sz > 0 and not soup.select("div.product")):
-            logging.warning(
-                "No products parsed in this chunk; breaking pagination early."
-            )
-            break
+def extract_products_for_categories(
+    categories: list[str], max_workers: int = 4
+) -> pl.DataFrame:
+    """
+    Extracts the products of several top-level categories concurrently.
 
-    df = pl.DataFrame(items)
-    logging.info("Extracted %d products for cgid=%s", len(items), cgid)
-    return df
+    Each category is extracted with `extract_products` on its own worker thread,
+    so the network latency of one category overlaps with the others. Requests
+    still go through the shared rate limit of `utils.content`.
+
+    Parameters:
+    categories (list[str]): Top-level category slugs (see `extract_category_slugs`).
+    max_workers (int, optional): The number of categories extracted concurrently. Defaults to 4.
+
+    Returns:
+    pl.DataFrame: The products of every category, in the order of `categories`.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(
+            executor.map(
+                lambda category: extract_products(
+                    f"https://www.ahorramas.com/{category}/"
+                ),
+                categories,
+            )
+        )
+    # Stack the category frames as-is and compact them into contiguous buffers once
+    return pl.concat(frames, how="vertical_relaxed", rechunk=False).rechunk()
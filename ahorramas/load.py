@@ -1,167 +1,165 @@
-# Add the parent directory to the sys.path
-import sys
 from os.path import dirname, abspath
+import gzip
 import os
 import logging
 import polars as pl
-from datetime import datetime
-from utils.postgres import execute_query
+from datetime import datetime, timezone
+from utils.postgres import execute_query, load_rows, transaction
 
 
-sys.path.append(dirname(dirname(abspath(__file__))))
+# Output directory for JSON dumps (ahorramas/data), resolved once at import
+_DATA_DIR = os.path.join(dirname(abspath(__file__)), "data")
 
 
-def load_data(data: pl.DataFrame, file_name: str) -> None:
+def load_data(data: pl.DataFrame, file_name: str, legacy_json: bool = False) -> None:
     """
-    Load Ahorramas data on a JSON file
+    Load Ahorramas data on a gzip-compressed NDJSON file
+
+    The file is written next to `file_name` with its extension replaced by
+    `.ndjson.gz` (e.g. supermarkets.json -> supermarkets.ndjson.gz). Gzip level 1
+    keeps the compression cost below the I/O it saves.
 
     Parameters:
     - data (pl.DataFrame): Ahorramas data.
     - file_name (str): Name of the JSON file.
+    - legacy_json (bool): Write an uncompressed JSON array to `file_name` instead.
 
     Returns:
     - None
     """
-    output_directory = dirname(dirname(abspath(__file__))) + "/ahorramas/data"
-    os.makedirs(output_directory, exist_ok=True)
-    output_path = os.path.join(output_directory, file_name)
+    os.makedirs(_DATA_DIR, exist_ok=True)
+    if not legacy_json:
+        file_name = os.path.splitext(file_name)[0] + ".ndjson.gz"
+    output_path = os.path.join(_DATA_DIR, file_name)
     logging.info("Saving Ahorramas supermarkets metadata into file: %s", file_name)
-    with open(output_path, "w", encoding="utf-8") as file:
-        data.write_json(file)
+    if legacy_json:
+        # Given a path, polars serializes and writes the file natively with its own
+        # buffered writer instead of pushing the output through a Python text handle
+        data.write_json(output_path)
+    else:
+        # Serialize in polars, then compress; handing polars the gzip file object
+        # would let it write straight to the underlying path, uncompressed
+        with gzip.open(output_path, "wb", compresslevel=1) as gz:
+            gz.write(data.write_ndjson().encode("utf-8"))
     logging.info("Ahorramas supermarkets metadata saved into file: %s", file_name)
 
 
-def load_raw_data_to_postgres(data: pl.DataFrame) -> None:
+def raw_table_name(prefix: str) -> str:
     """
-    Load raw supermarkets data to PostgreSQL with date-based table naming.
+    Build the date-based name of a raw table, e.g. supermarket_YYYYMMDD.
 
-    Creates a table with format: raw.supermarket_YYYYMMDD
-    Each DataFrame column becomes a text column in PostgreSQL.
-    If table exists, it will be replaced to avoid duplicates.
+    The date is taken in UTC so every command run on the same day resolves to
+    the same table regardless of the host's local timezone.
 
     Parameters:
-    - data (pl.DataFrame): Raw supermarkets data from API
+    - prefix (str): Table name prefix (e.g. "supermarket" or "products")
+
+    Returns:
+    - str: Raw table name without the schema
+    """
+    return f"{prefix}_{datetime.now(timezone.utc):%Y%m%d}"
+
+
+def _load_raw_table(data: pl.DataFrame, table_name: str, kind: str) -> None:
+    """
+    Replace a raw table with the contents of a DataFrame.
+
+    Each DataFrame column becomes a text column in PostgreSQL. The table is
+    dropped, recreated and loaded in one transaction, so a failed load leaves
+    the previous table in place and everything commits once.
+
+    Parameters:
+    - data (pl.DataFrame): Raw data to load
+    - table_name (str): Raw table name without the schema
+    - kind (str): What the table holds, for log messages (e.g. "products")
 
     Returns:
     - None
     """
-    # Generate table name with current date
-    current_date = datetime.now().strftime("%Y%m%d")
-    table_name = f"supermarket_{current_date}"
     full_table_name = f"raw.{table_name}"
 
-    logging.info("Creating raw data table: %s", full_table_name)
+    logging.info("Creating raw %s table: %s", kind, full_table_name)
 
     # Get DataFrame columns and create table columns
     columns = data.columns
     column_definitions = [f'"{col}" TEXT' for col in columns]
 
-    # Drop table if exists and recreate to avoid duplicates
+    # Drop table if exists and recreate to avoid duplicates. Raw tables are a
+    # one-shot load that can be re-extracted, so they're UNLOGGED: the COPY skips
+    # WAL entirely, at the cost of the table being emptied after a crash
     drop_table_query = f"DROP TABLE IF EXISTS {full_table_name};"
     create_table_query = f"""
-    CREATE TABLE {full_table_name} (
+    CREATE UNLOGGED TABLE {full_table_name} (
         {", ".join(column_definitions)}
     );
     """
 
     try:
-        # Drop existing table and recreate
-        execute_query(drop_table_query, fetch=False)
-        execute_query(create_table_query, fetch=False)
-
-        logging.info("Raw data table created successfully")
-
-        # Insert data row by row
-        for row in data.iter_rows(named=True):
-            # Create placeholders for each column
-            placeholders = ", ".join(["%s"] * len(columns))
-            column_names = ", ".join([f'"{col}"' for col in columns])
-
-            insert_query = f"""
-            INSERT INTO {full_table_name} ({column_names}) 
-            VALUES ({placeholders});
-            """
-
-            # Get values in the same order as columns
-            values = [
-                str(row[col]) if row[col] is not None else None for col in columns
-            ]
-            execute_query(insert_query, values, fetch=False)
+        with transaction() as cursor:
+            cursor.execute(drop_table_query)
+            cursor.execute(create_table_query)
+
+            logging.info("Raw %s table created successfully", kind)
+
+            # Stream every row in a single binary COPY (raw columns are all TEXT),
+            # or batched INSERTs where COPY isn't allowed; values are stringified
+            # once, vectorized in polars, beforehand
+            load_rows(
+                cursor,
+                full_table_name,
+                columns,
+                data.with_columns(pl.all().cast(pl.Utf8, strict=False)).rows(),
+            )
 
         logging.info(
-            "Raw data loaded to PostgreSQL successfully in table: %s", full_table_name
+            "Raw %s loaded to PostgreSQL successfully in table: %s",
+            kind,
+            full_table_name,
         )
 
     except Exception as e:
-        logging.error("Error loading raw data to PostgreSQL: %s", e)
+        logging.error("Error loading raw %s to PostgreSQL: %s", kind, e)
         raise
 
 
-def load_raw_products_to_postgres(data: pl.DataFrame) -> None:
+def load_raw_data_to_postgres(
+    data: pl.DataFrame, table_name: str | None = None
+) -> None:
     """
-    Load raw products data to PostgreSQL with date-based table naming.
+    Load raw supermarkets data to PostgreSQL with date-based table naming.
 
-    Creates a table with format: raw.products_YYYYMMDD
+    Creates a table with format: raw.supermarket_YYYYMMDD
     Each DataFrame column becomes a text column in PostgreSQL.
     If table exists, it will be replaced to avoid duplicates.
 
     Parameters:
-    - data (pl.DataFrame): Raw products data from extraction
+    - data (pl.DataFrame): Raw supermarkets data from API
+    - table_name (str | None): Raw table name; defaults to today's supermarket_YYYYMMDD
 
     Returns:
     - None
     """
-    # Generate table name with current date
-    current_date = datetime.now().strftime("%Y%m%d")
-    table_name = f"products_{current_date}"
-    full_table_name = f"raw.{table_name}"
+    _load_raw_table(data, table_name or raw_table_name("supermarket"), "data")
 
-    logging.info("Creating raw products table: %s", full_table_name)
 
-    # Get DataFrame columns and create table columns
-    columns = data.columns
-    column_definitions = [f'"{col}" TEXT' for col in columns]
-
-    # Drop table if exists and recreate to avoid duplicates
-    drop_table_query = f"DROP TABLE IF EXISTS {full_table_name};"
-    create_table_query = f"""
-    CREATE TABLE {full_table_name} (
-        {", ".join(column_definitions)}
-    );
+def load_raw_products_to_postgres(
+    data: pl.DataFrame, table_name: str | None = None
+) -> None:
     """
+    Load raw products data to PostgreSQL with date-based table naming.
 
-    try:
-        # Drop existing table and recreate
-        execute_query(drop_table_query, fetch=False)
-        execute_query(create_table_query, fetch=False)
-
-        logging.info("Raw products table created successfully")
-
-        # Insert data row by row
-        for row in data.iter_rows(named=True):
-            # Create placeholders for each column
-            placeholders = ", ".join(["%s"] * len(columns))
-            column_names = ", ".join([f'"{col}"' for col in columns])
-
-            insert_query = f"""
-            INSERT INTO {full_table_name} ({column_names}) 
-            VALUES ({placeholders});
-            """
-
-            # Get values in the same order as columns
-            values = [
-                str(row[col]) if row[col] is not None else None for col in columns
-            ]
-            execute_query(insert_query, values, fetch=False)
+    Creates a table with format: raw.products_YYYYMMDD
+    Each DataFrame column becomes a text column in PostgreSQL.
+    If table exists, it will be replaced to avoid duplicates.
 
-        logging.info(
-            "Raw products data loaded to PostgreSQL successfully in table: %s",
-            full_table_name,
-        )
+    Parameters:
+    - data (pl.DataFrame): Raw products data from extraction
+    - table_name (str | None): Raw table name; defaults to today's products_YYYYMMDD
 
-    except Exception as e:
-        logging.error("Error loading raw products data to PostgreSQL: %s", e)
-        raise
+    Returns:
+    - None
+    """
+    _load_raw_table(data, table_name or raw_table_name("products"), "products")
 
 
 def create_staging_supermarkets_table():
@@ -249,7 +247,10 @@ def create_prod_supermarkets_table():
     create_prod_indexes_query = """
     CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_store_id ON prod.supermarkets(store_id);
     CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_location ON prod.supermarkets(latitude, longitude);
-    CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_active ON prod.supermarkets(is_active);
+    -- Reads only ever want active rows: index those instead of the boolean itself
+    DROP INDEX IF EXISTS prod.idx_prod_supermarkets_active;
+    CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_active_extracted_date ON prod.supermarkets(extracted_date) WHERE is_active;
+    CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_active_name ON prod.supermarkets(name) WHERE is_active;
     CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_extracted_date ON prod.supermarkets(extracted_date);
     CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_name ON prod.supermarkets(name);
     """
@@ -259,17 +260,17 @@ def create_prod_supermarkets_table():
     logging.info("Production schema and table structure created successfully")
 
 
-def load_staging_data_from_raw(raw_table_name: str):
+def load_staging_data_from_raw(table_name: str):
     """
     Load and consolidate data from raw schema to staging schema.
 
     Parameters:
-    - raw_table_name (str): Name of the raw table to consolidate
+    - table_name (str): Name of the raw table to consolidate
     """
-    logging.info(f"Loading staging data from raw.{raw_table_name}...")
+    logging.info("Loading staging data from raw.%s...", table_name)
 
     # Get the extracted date from table name
-    extracted_date = raw_table_name.replace("supermarket_", "")
+    extracted_date = table_name.replace("supermarket_", "")
 
     # Create staging table if it doesn't exist
     create_staging_supermarkets_table()
@@ -294,7 +295,10 @@ def load_staging_data_from_raw(raw_table_name: str):
 
     execute_query(delete_existing_query, fetch=False)
     logging.info(
-        f"Deleted existing staging data for date: {extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}"
+        "Deleted existing staging data for date: %s-%s-%s",
+        extracted_date[:4],
+        extracted_date[4:6],
+        extracted_date[6:8],
     )
 
     # Insert consolidated data into staging table
@@ -317,12 +321,12 @@ def load_staging_data_from_raw(raw_table_name: str):
         END as longitude,
         '{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}'::date as extracted_date,
         'ahorramas' as name
-    FROM raw.{raw_table_name};
+    FROM raw.{table_name};
     """
 
     execute_query(insert_staging_query, fetch=False)
 
-    logging.info(f"Staging data loaded from raw.{raw_table_name} successfully")
+    logging.info("Staging data loaded from raw.%s successfully", table_name)
 
 
 def load_prod_data_from_staging():
@@ -489,7 +493,10 @@ def create_prod_products_table():
     create_prod_indexes_query = """
     CREATE INDEX IF NOT EXISTS idx_prod_products_name ON prod.products(name);
     CREATE INDEX IF NOT EXISTS idx_prod_products_price ON prod.products(price);
-    CREATE INDEX IF NOT EXISTS idx_prod_products_active ON prod.products(is_active);
+    -- Reads only ever want active rows: index those instead of the boolean itself
+    DROP INDEX IF EXISTS prod.idx_prod_products_active;
+    CREATE INDEX IF NOT EXISTS idx_prod_products_active_extracted_date ON prod.products(extracted_date) WHERE is_active;
+    CREATE INDEX IF NOT EXISTS idx_prod_products_active_supermarket ON prod.products(supermarket) WHERE is_active;
     CREATE INDEX IF NOT EXISTS idx_prod_products_extracted_date ON prod.products(extracted_date);
     """
     execute_query(create_prod_indexes_query, fetch=False)
@@ -497,16 +504,16 @@ def create_prod_products_table():
     logging.info("Production products schema and table structure created successfully")
 
 
-def load_staging_products_from_raw(raw_table_name: str):
+def load_staging_products_from_raw(table_name: str):
     """
     Load and consolidate products data from raw schema to staging schema.
 
     Parameters:
-    - raw_table_name (str): Name of the raw table to consolidate
+    - table_name (str): Name of the raw table to consolidate
     """
-    logging.info(f"Loading staging products data from raw.{raw_table_name}...")
+    logging.info("Loading staging products data from raw.%s...", table_name)
 
-    extracted_date = raw_table_name.replace("products_", "")
+    extracted_date = table_name.replace("products_", "")
 
     create_staging_products_table()
 
@@ -540,7 +547,7 @@ def load_staging_products_from_raw(raw_table_name: str):
         COALESCE(url, '') AS url,
         'ahorramas' AS supermarket,
         '{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}'::date AS extracted_date
-    FROM raw.{raw_table_name}
+    FROM raw.{table_name}
     WHERE COALESCE(name, '') <> ''
     ORDER BY name, extracted_date, "discount-value" DESC, price DESC
     ON CONFLICT (name, extracted_date) DO UPDATE SET
@@ -555,7 +562,7 @@ def load_staging_products_from_raw(raw_table_name: str):
 
     execute_query(insert_staging_query, fetch=False)
 
-    logging.info(f"Staging products upserted from raw.{raw_table_name} successfully")
+    logging.info("Staging products upserted from raw.%s successfully", table_name)
 
 
 def load_prod_products_from_staging():
@@ -3,64 +3,55 @@ import click
 
 import sys
 from os.path import abspath, dirname
-import polars as pl
-
-# Add the parent directory to the sys.path
-sys.path.append(dirname(dirname(abspath(__file__))))
-
-from utils.postgres import close_pool, configure_products_search
-from load import (
-    load_raw_data_to_postgres,
-    load_staging_data_from_raw,
-    load_prod_data_from_staging,
-    create_staging_supermarkets_table,
-    create_prod_supermarkets_table,
-    load_raw_products_to_postgres,
-    load_staging_products_from_raw,
-    load_prod_products_from_staging,
-    create_staging_products_table,
-    create_prod_products_table,
-)
+
+# Add the parent directory to the sys.path. This is the CLI entry point, so it's
+# the only module that needs it: extract/load and utils are imported after it
+_ROOT_DIR = dirname(dirname(abspath(__file__)))
+if _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
+
 from utils.logger import configure_logging
-from extract import (
-    extract_products,
-    extract_supermarkets,
-    extract_categories,
-    extract_category_slugs,
-)
+
+# The extract/load modules pull in polars, bs4 and psycopg2, so each command
+# imports what it uses; --help and group listings don't pay for them
 
 
 @click.group()
+@click.option("--debug", is_flag=True, help="Enable debug mode.")
 @click.pass_context
-def cli(ctx):
+def cli(ctx, debug):
     """Ahorramas CLI Tool"""
     ctx.ensure_object(dict)
+    # Configure logging once for the whole invocation, before any group runs
+    configure_logging(debug)
 
 
 @cli.group()
-@click.option("--debug", is_flag=True, help="Enable debug mode.")
 @click.pass_context
-def supermarket(ctx, debug):
+def supermarket(ctx):
     """Supermarket data pipeline commands"""
     ctx.ensure_object(dict)
-    configure_logging(debug)
 
 
 @supermarket.command()
 @click.pass_context
 def extract_raw(ctx):
     """Extract raw data from API to PostgreSQL"""
+    from extract import extract_supermarkets
+    from load import load_raw_data_to_postgres
+    from utils.postgres import close_pool
+
     try:
         logging.info("Extracting raw supermarkets data from API")
         df = extract_supermarkets()
 
-        logging.info(f"Found {len(df)} raw supermarkets records to load...")
+        logging.info("Found %d raw supermarkets records to load...", len(df))
 
         # Load raw data to PostgreSQL with date-based table naming
         load_raw_data_to_postgres(df)
 
     except Exception as e:
-        logging.error(f"Error loading raw data: {e}")
+        logging.error("Error loading raw data: %s", e)
         raise
     finally:
         close_pool()
@@ -70,22 +61,22 @@ def extract_raw(ctx):
 @click.pass_context
 def transform_staging(ctx):
     """Transform raw data to staging schema"""
+    from load import raw_table_name, load_staging_data_from_raw
+    from utils.postgres import close_pool
+
     try:
         logging.info("Transforming raw data to staging schema")
 
-        # Get the most recent raw table
-        from datetime import datetime
-
-        current_date = datetime.now().strftime("%Y%m%d")
-        raw_table_name = f"supermarket_{current_date}"
+        # Resolve today's raw table name
+        table_name = raw_table_name("supermarket")
 
         # Consolidate data to staging
-        load_staging_data_from_raw(raw_table_name)
+        load_staging_data_from_raw(table_name)
 
         logging.info("Data transformed to staging successfully")
 
     except Exception as e:
-        logging.error(f"Error transforming to staging: {e}")
+        logging.error("Error transforming to staging: %s", e)
         raise
     finally:
         close_pool()
@@ -95,6 +86,9 @@ def transform_staging(ctx):
 @click.pass_context
 def deploy_prod(ctx):
     """Deploy staging data to production"""
+    from load import load_prod_data_from_staging
+    from utils.postgres import close_pool
+
     try:
         logging.info("Deploying staging data to production")
 
@@ -104,7 +98,7 @@ def deploy_prod(ctx):
         logging.info("Data deployed to production successfully")
 
     except Exception as e:
-        logging.error(f"Error deploying to production: {e}")
+        logging.error("Error deploying to production: %s", e)
         raise
     finally:
         close_pool()
@@ -114,58 +108,69 @@ def deploy_prod(ctx):
 @click.pass_context
 def run_pipeline(ctx):
     """Execute complete data pipeline"""
+    from extract import extract_supermarkets
+    from load import (
+        load_raw_data_to_postgres,
+        raw_table_name,
+        load_staging_data_from_raw,
+        load_prod_data_from_staging,
+        create_staging_supermarkets_table,
+        create_prod_supermarkets_table,
+    )
+    from utils.postgres import close_pool, session
+
     try:
         logging.info("Starting full data pipeline execution")
 
         # Step 1: Extract and load raw data
         logging.info("Step 1: Extracting and loading raw data")
         df = extract_supermarkets()
-        logging.info(f"Found {len(df)} raw supermarkets records to load...")
+        logging.info("Found %d raw supermarkets records to load...", len(df))
 
-        # Generate table name for raw data
-        from datetime import datetime
+        # Resolve the raw table name once so the load and staging steps agree
+        table_name = raw_table_name("supermarket")
 
-        current_date = datetime.now().strftime("%Y%m%d")
-        raw_table_name = f"supermarket_{current_date}"
+        # Run every load step on one connection, as a single transaction
+        with session():
+            # Load raw data to PostgreSQL
+            load_raw_data_to_postgres(df, table_name)
 
-        # Load raw data to PostgreSQL
-        load_raw_data_to_postgres(df)
-
-        # Step 2: Create schemas if they don't exist
-        logging.info("Step 2: Creating schemas and table structures")
-        create_staging_supermarkets_table()
-        create_prod_supermarkets_table()
+            # Step 2: Create schemas if they don't exist
+            logging.info("Step 2: Creating schemas and table structures")
+            create_staging_supermarkets_table()
+            create_prod_supermarkets_table()
 
-        # Step 3: Consolidate to staging
-        logging.info("Step 3: Transforming data to staging")
-        load_staging_data_from_raw(raw_table_name)
+            # Step 3: Consolidate to staging
+            logging.info("Step 3: Transforming data to staging")
+            load_staging_data_from_raw(table_name)
 
-        # Step 4: Promote to production
-        logging.info("Step 4: Deploying data to production")
-        load_prod_data_from_staging()
+            # Step 4: Promote to production
+            logging.info("Step 4: Deploying data to production")
+            load_prod_data_from_staging()
 
         logging.info("Full data pipeline completed successfully!")
 
     except Exception as e:
-        logging.error(f"Error in full data pipeline: {e}")
+        logging.error("Error in full data pipeline: %s", e)
         raise
     finally:
         close_pool()
 
 
 @cli.group()
-@click.option("--debug", is_flag=True, help="Enable debug mode.")
 @click.pass_context
-def products(ctx, debug):
+def products(ctx):
     """Products data pipeline commands"""
     ctx.ensure_object(dict)
-    configure_logging(debug)
 
 
 @products.command()
 @click.pass_context
 def get_categories(ctx):
     """Extract categories from Ahorramas website"""
+    from extract import extract_categories
+    from utils.postgres import close_pool
+
     try:
         logging.info("Extracting categories from Ahorramas website")
 
@@ -173,13 +178,13 @@ def get_categories(ctx):
         categories = extract_categories()
 
         # Log the categories
-        logging.info(f"Found {len(categories)} categories")
-        logging.info(f"Categories: {categories}")
+        logging.info("Found %d categories", len(categories))
+        logging.info("Categories: %s", categories)
 
         logging.info("Categories extracted and saved successfully")
 
     except Exception as e:
-        logging.error(f"Error extracting categories: {e}")
+        logging.error("Error extracting categories: %s", e)
         raise
     finally:
         close_pool()
@@ -189,9 +194,11 @@ def get_categories(ctx):
 @click.pass_context
 def get_category_slugs(ctx):
     """Extract category slugs from Ahorramas website"""
+    from extract import extract_category_slugs
+
     logging.info("Extracting category slugs from Ahorramas website")
     category_slugs = extract_category_slugs()
-    logging.info(f"Found {len(category_slugs)} category slugs")
+    logging.info("Found %d category slugs", len(category_slugs))
     logging.info(category_slugs)
 
 
@@ -199,46 +206,51 @@ def get_category_slugs(ctx):
 @click.pass_context
 def get_products(ctx):
     """Extract products from all categories and save to PostgreSQL"""
+    from extract import extract_products_for_categories, extract_category_slugs
+    from load import (
+        raw_table_name,
+        load_raw_products_to_postgres,
+        load_staging_products_from_raw,
+        load_prod_products_from_staging,
+        create_staging_products_table,
+        create_prod_products_table,
+    )
+    from utils.postgres import close_pool, session
+
     try:
         logging.info("Extracting products from all categories")
         categories = extract_category_slugs()
 
-        # Extract products for each category and merge them into a single dataframe
-        df = pl.concat(
-            [
-                extract_products(f"https://www.ahorramas.com/{category}/")
-                for category in categories
-            ]
-        )
-        logging.info(f"Found {len(df)} products")
+        # Extract products for every category concurrently into a single dataframe
+        df = extract_products_for_categories(categories)
+        logging.info("Found %d products", len(df))
 
-        # Load raw products data to PostgreSQL
-        logging.info("Loading raw products data to PostgreSQL")
-        load_raw_products_to_postgres(df)
+        # Resolve the raw table name once so the load and staging steps agree
+        table_name = raw_table_name("products")
 
-        # Create schemas and table structures
-        logging.info("Creating schemas and table structures for products")
-        create_staging_products_table()
-        create_prod_products_table()
+        # Run every load step on one connection, as a single transaction
+        with session():
+            # Load raw products data to PostgreSQL
+            logging.info("Loading raw products data to PostgreSQL")
+            load_raw_products_to_postgres(df, table_name)
 
-        # Get the most recent raw table name
-        from datetime import datetime
+            # Create schemas and table structures
+            logging.info("Creating schemas and table structures for products")
+            create_staging_products_table()
+            create_prod_products_table()
 
-        current_date = datetime.now().strftime("%Y%m%d")
-        raw_table_name = f"products_{current_date}"
+            # Transform to staging
+            logging.info("Transforming products data to staging")
+            load_staging_products_from_raw(table_name)
 
-        # Transform to staging
-        logging.info("Transforming products data to staging")
-        load_staging_products_from_raw(raw_table_name)
-
-        # Promote to production
-        logging.info("Promoting products data to production")
-        load_prod_products_from_staging()
+            # Promote to production
+            logging.info("Promoting products data to production")
+            load_prod_products_from_staging()
 
         logging.info("Products pipeline completed successfully!")
 
     except Exception as e:
-        logging.error(f"Error in products pipeline: {e}")
+        logging.error("Error in products pipeline: %s", e)
         raise
     finally:
         close_pool()
@@ -248,24 +260,23 @@ def get_products(ctx):
 @click.pass_context
 def extract_raw_products(ctx):
     """Extract raw products data from all categories to PostgreSQL"""
+    from extract import extract_products_for_categories, extract_category_slugs
+    from load import load_raw_products_to_postgres
+    from utils.postgres import close_pool
+
     try:
         logging.info("Extracting raw products data from all categories")
         categories = extract_category_slugs()
 
-        # Extract products for each category and merge them into a single dataframe
-        df = pl.concat(
-            [
-                extract_products(f"https://www.ahorramas.com/{category}/")
-                for category in categories
-            ]
-        )
-        logging.info(f"Found {len(df)} products")
+        # Extract products for every category concurrently into a single dataframe
+        df = extract_products_for_categories(categories)
+        logging.info("Found %d products", len(df))
 
         # Load raw products data to PostgreSQL
         load_raw_products_to_postgres(df)
 
     except Exception as e:
-        logging.error(f"Error extracting raw products data: {e}")
+        logging.error("Error extracting raw products data: %s", e)
         raise
     finally:
         close_pool()
@@ -275,22 +286,22 @@ def extract_raw_products(ctx):
 @click.pass_context
 def transform_staging_products(ctx):
     """Transform raw products data to staging schema"""
+    from load import raw_table_name, load_staging_products_from_raw
+    from utils.postgres import close_pool
+
     try:
         logging.info("Transforming raw products data to staging schema")
 
-        # Get the most recent raw table
-        from datetime import datetime
-
-        current_date = datetime.now().strftime("%Y%m%d")
-        raw_table_name = f"products_{current_date}"
+        # Resolve today's raw table name
+        table_name = raw_table_name("products")
 
         # Consolidate data to staging
-        load_staging_products_from_raw(raw_table_name)
+        load_staging_products_from_raw(table_name)
 
         logging.info("Products data transformed to staging successfully")
 
     except Exception as e:
-        logging.error(f"Error transforming products to staging: {e}")
+        logging.error("Error transforming products to staging: %s", e)
         raise
     finally:
         close_pool()
@@ -300,6 +311,9 @@ def transform_staging_products(ctx):
 @click.pass_context
 def deploy_prod_products(ctx):
     """Deploy staging products data to production"""
+    from load import load_prod_products_from_staging
+    from utils.postgres import close_pool
+
     try:
         logging.info("Deploying staging products data to production")
 
@@ -309,7 +323,7 @@ def deploy_prod_products(ctx):
         logging.info("Products data deployed to production successfully")
 
     except Exception as e:
-        logging.error(f"Error deploying products to production: {e}")
+        logging.error("Error deploying products to production: %s", e)
         raise
     finally:
         close_pool()
@@ -319,41 +333,46 @@ def deploy_prod_products(ctx):
 @click.pass_context
 def run_products_pipeline(ctx):
     """Execute complete products data pipeline"""
+    from extract import extract_products_for_categories, extract_category_slugs
+    from load import (
+        raw_table_name,
+        load_raw_products_to_postgres,
+        load_staging_products_from_raw,
+        load_prod_products_from_staging,
+        create_staging_products_table,
+        create_prod_products_table,
+    )
+    from utils.postgres import close_pool, configure_products_search, session
+
     try:
         logging.info("Starting full products data pipeline execution")
 
         # Step 1: Extract and load raw data
         logging.info("Step 1: Extracting and loading raw products data")
         categories = extract_category_slugs()
-        df = pl.concat(
-            [
-                extract_products(f"https://www.ahorramas.com/{category}/")
-                for category in categories
-            ]
-        )
-        logging.info(f"Found {len(df)} products")
-
-        # Generate table name for raw data
-        from datetime import datetime
+        df = extract_products_for_categories(categories)
+        logging.info("Found %d products", len(df))
 
-        current_date = datetime.now().strftime("%Y%m%d")
-        raw_table_name = f"products_{current_date}"
+        # Resolve the raw table name once so the load and staging steps agree
+        table_name = raw_table_name("products")
 
-        # Load raw data to PostgreSQL
-        load_raw_products_to_postgres(df)
+        # Run every load step on one connection, as a single transaction
+        with session():
+            # Load raw data to PostgreSQL
+            load_raw_products_to_postgres(df, table_name)
 
-        # Step 2: Create schemas if they don't exist
-        logging.info("Step 2: Creating schemas and table structures")
-        create_staging_products_table()
-        create_prod_products_table()
+            # Step 2: Create schemas if they don't exist
+            logging.info("Step 2: Creating schemas and table structures")
+            create_staging_products_table()
+            create_prod_products_table()
 
-        # Step 3: Consolidate to staging
-        logging.info("Step 3: Transforming products data to staging")
-        load_staging_products_from_raw(raw_table_name)
+            # Step 3: Consolidate to staging
+            logging.info("Step 3: Transforming products data to staging")
+            load_staging_products_from_raw(table_name)
 
-        # Step 4: Promote to production
-        logging.info("Step 4: Deploying products data to production")
-        load_prod_products_from_staging()
+            # Step 4: Promote to production
+            logging.info("Step 4: Deploying products data to production")
+            load_prod_products_from_staging()
 
         # Step 5: Configure search functionality
         logging.info("Step 5: Configuring products search functionality")
@@ -362,7 +381,7 @@ def run_products_pipeline(ctx):
         logging.info("Full products data pipeline completed successfully!")
 
     except Exception as e:
-        logging.error(f"Error in full products data pipeline: {e}")
+        logging.error("Error in full products data pipeline: %s", e)
         raise
     finally:
         close_pool()
@@ -1,41 +1,86 @@
-import sys
 import logging
 from os.path import dirname, abspath
 import polars as pl
-from bs4 import BeautifulSoup
+from lxml import etree
+from html import unescape
 from urllib.parse import urlparse, urljoin
 import re
-import json
+import orjson
+from functools import lru_cache
 import os
+import mmap
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-# Add the parent directory to the sys.path
-sys.path.append(dirname(dirname(abspath(__file__))))
-
-
-def read_xml_file() -> str:
-    """
-    Read supermarkets data from local XML file
-
-    Returns:
-        str: XML content as string
-    """
-    try:
-        xml_path = dirname(abspath(__file__)) + "/locations.xml"
-        logging.info("Reading supermarkets data from local XML file: %s", xml_path)
-
-        with open(xml_path, "r", encoding="utf-8") as file:
-            xml_content = file.read()
-
-        logging.info("Successfully read XML file with %d characters", len(xml_content))
-        return xml_content
-
-    except FileNotFoundError:
-        logging.error("XML file not found: %s", xml_path)
-        raise FileNotFoundError(f"XML file not found: {xml_path}")
-    except Exception as e:
-        logging.error("Error reading XML file: %s", e)
-        raise
+from utils.logger import configure_logging
+
+# Carrefour store locator dump, shipped alongside this module
+_LOCATIONS_XML = dirname(abspath(__file__)) + "/locations.xml"
+
+# JavaScript 'impressions' array embedded in product listing pages
+_IMPRESSIONS_RE = re.compile(rb'window\["impressions"\]\s*=\s*(\[.*?\]);', re.DOTALL)
+# Opening tag of a product card title
+_PRODUCT_CARD_TITLE = (
+    rb'<h2[^>]*\sclass="(?:[^"]*\s)?product-card__title(?:\s[^"]*)?"[^>]*>'
+)
+_PRODUCT_CARD_TITLE_RE = re.compile(_PRODUCT_CARD_TITLE)
+# Link inside a product card title, capturing its href and (tag-free) text
+_PRODUCT_CARD_RE = re.compile(
+    _PRODUCT_CARD_TITLE + rb'\s*<a[^>]*\shref="([^"]*)"[^>]*>([^<]*)</a>'
+)
+# Category id (e.g. cat20002) inside a category link
+_CAT_ID_RE = re.compile(r"(cat\d+)")
+
+# Filename tokens (category slug or id) -> readable category
+_CATEGORY_BY_TOKEN = {
+    "productos-frescos": "Productos Frescos",
+    "la-despensa": "La Despensa",
+    "parafarmacia": "Parafarmacia",
+    "mascotas": "Mascotas",
+    "bebe": "Bebé",
+    "cat20002": "Productos Frescos",
+    "cat20001": "La Despensa",
+    "cat20008": "Parafarmacia",
+    "cat20007": "Mascotas",
+    "cat20006": "Bebé",
+}
+_CATEGORY_TOKEN_RE = re.compile(
+    r"(?i:(productos-frescos|la-despensa|parafarmacia|mascotas|bebe))"
+    r"|(cat2000[12678])"
+)
+
+# <marker> attributes read from locations.xml
+_MARKER_ATTRIBUTES = (
+    "lat",
+    "lng",
+    "codsa",
+    "codat",
+    "tcm",
+    "id",
+    "address",
+    "address2",
+    "postal",
+    "city",
+    "state",
+    "hours1",
+    "hours2",
+    "name",
+    "category",
+)
+
+_PRODUCT_SCHEMA = {
+    "discount_value": pl.Utf8,
+    "price": pl.Float64,
+    "price_per_unit": pl.Utf8,
+    "name": pl.Utf8,
+    "image": pl.Utf8,
+    "url": pl.Utf8,
+    "supermarket": pl.Utf8,
+    "source_file": pl.Utf8,
+    "extracted_category": pl.Utf8,
+}
 
 
 def extract_supermarkets() -> pl.DataFrame:
@@ -45,84 +90,95 @@ def extract_supermarkets() -> pl.DataFrame:
     Returns:
         pl.DataFrame: Columns -> store_id, address, schedule, holidays, latitude, longitude, name, category
     """
-    # Read from local XML file instead of HTTP request
-    raw_xml = read_xml_file()
-    soup = BeautifulSoup(raw_xml, "html.parser")
-
-    items = []
-
-    # Directly parse <marker .../> nodes inside <markers>
-    stores = soup.find_all("marker")
-
-    # Helper to join address parts cleanly
-    def join_addr(parts: list[str]) -> str:
-        return ", ".join([p.strip() for p in parts if p and p.strip()])
-
-    for m in stores:
-        # Coordinates (required)
-        lat = (m.get("lat") or "").strip()
-        lng = (m.get("lng") or "").strip()
-        if not lat or not lng:
-            continue
-        try:
-            lat_f = float(lat)
-            lng_f = float(lng)
-            if not (-90.0 <= lat_f <= 90.0 and -180.0 <= lng_f <= 180.0):
-                continue
-        except ValueError:
-            continue
-
-        # Stable store_id: prefer codsa, then codat, then tcm/id as fallback (no more from XML)
-        store_id = (
-            m.get("codsa") or m.get("codat") or m.get("tcm") or m.get("id") or ""
-        ).strip()
-        if not store_id:
-            # As a last resort, hash lat/lng + address (no more from XML)
-            store_id = f"{lat_f:.5f},{lng_f:.5f}"
-
-        # Address: address + address2 + postal + city + state (province)
-        address = join_addr(
-            [
-                m.get("address"),
-                m.get("address2"),
-                m.get("postal"),
-                m.get("city"),
-                m.get("state"),
-            ]
+    if not os.path.exists(_LOCATIONS_XML):
+        logging.error("XML file not found: %s", _LOCATIONS_XML)
+        raise FileNotFoundError(f"XML file not found: {_LOCATIONS_XML}")
+    logging.info("Reading supermarkets data from local XML file: %s", _LOCATIONS_XML)
+
+    # Raw attribute values, one list per attribute; all cleaning happens below in
+    # vectorized polars expressions rather than per marker in Python
+    raw = {attribute: [] for attribute in _MARKER_ATTRIBUTES}
+
+    # Stream the <marker .../> nodes straight from the file; only their attributes
+    # are needed, so no tree is kept around
+    for _, marker in etree.iterparse(_LOCATIONS_XML, events=("end",), tag="marker"):
+        for attribute, values in raw.items():
+            values.append(marker.get(attribute))
+        # Free the element and the siblings already processed so memory stays flat
+        marker.clear()
+        while marker.getprevious() is not None:
+            del marker.getparent()[0]
+
+    def stripped(attribute: str) -> pl.Expr:
+        # Stripped value, null when missing or blank
+        value = pl.col(attribute).str.strip_chars()
+        return pl.when(value != "").then(value)
+
+    df = (
+        pl.DataFrame(raw, schema={attribute: pl.Utf8 for attribute in raw})
+        # Coordinates (required, and within the valid range)
+        .with_columns(
+            stripped("lat").cast(pl.Float64, strict=False).alias("lat_f"),
+            stripped("lng").cast(pl.Float64, strict=False).alias("lng_f"),
         )
-
-        # Schedule: hours1 | hours2 (if present)
-        hours1 = (m.get("hours1") or "").strip()
-        hours2 = (m.get("hours2") or "").strip()
-        schedule = " | ".join([h for h in [hours1, hours2] if h])
-
-        # Holidays not provided -> leave empty to match your staging schema
-        holidays = ""
-
-        # Additional fields from XML
-        name = (m.get("name") or "").strip()
-        category = (m.get("category") or "").strip()
-
-        items.append(
-            {
-                "store_id": store_id,
-                "address": address,
-                "schedule": schedule,
-                "holidays": holidays,
-                "latitude": str(lat_f),
-                "longitude": str(lng_f),
-                "name": name,
-                "category": category,
-            }
+        .filter(
+            pl.col("lat_f").is_between(-90.0, 90.0)
+            & pl.col("lng_f").is_between(-180.0, 180.0)
+        )
+        .select(
+            # Stable store_id: prefer codsa, then codat, then tcm/id as fallback
+            pl.coalesce(
+                pl.when(pl.col(c) != "").then(pl.col(c))
+                for c in ("codsa", "codat", "tcm", "id")
+            )
+            .str.strip_chars()
+            .fill_null("")
+            .alias("store_id"),
+            # Address: address + address2 + postal + city + state (province)
+            pl.concat_str(
+                [
+                    stripped(c)
+                    for c in ("address", "address2", "postal", "city", "state")
+                ],
+                separator=", ",
+                ignore_nulls=True,
+            ).alias("address"),
+            # Schedule: hours1 | hours2 (if present)
+            pl.concat_str(
+                [stripped("hours1"), stripped("hours2")],
+                separator=" | ",
+                ignore_nulls=True,
+            ).alias("schedule"),
+            # Holidays not provided -> leave empty to match your staging schema
+            pl.lit("").alias("holidays"),
+            pl.col("lat_f").cast(pl.Utf8).alias("latitude"),
+            pl.col("lng_f").cast(pl.Utf8).alias("longitude"),
+            # Additional fields from XML
+            pl.col("name").str.strip_chars().fill_null(""),
+            pl.col("category").str.strip_chars().fill_null(""),
+            "lat_f",
+            "lng_f",
+        )
+    )
+
+    # As a last resort, identify the store by its lat/lng. Few stores need it,
+    # so the fixed-precision formatting is done in Python for just those rows
+    missing_id = df["store_id"] == ""
+    if missing_id.any():
+        fallback_ids = [
+            f"{lat_f:.5f},{lng_f:.5f}"
+            for lat_f, lng_f in df.filter(missing_id).select("lat_f", "lng_f").rows()
+        ]
+        df = df.with_columns(
+            df["store_id"].clone().scatter(missing_id.arg_true(), fallback_ids)
         )
+    df = df.drop("lat_f", "lng_f")
 
-    # Deduplicate by store_id; if missing, fall back to lat/lng pair
-    df = pl.DataFrame(items)
-    if df.height > 0:
-        if "store_id" in df.columns:
-            df = df.unique(subset=["store_id"])
-        else:
-            df = df.unique(subset=["latitude", "longitude"])
+    # Deduplicate by store_id (always set, lat/lng being its fallback), keeping
+    # the first marker of each store in file order
+    markers = df.height
+    df = df.unique(subset=["store_id"], keep="first", maintain_order=True)
+    logging.debug("Dropped %d duplicated store markers", markers - df.height)
 
     logging.info("Successfully extracted %d Carrefour stores", df.height)
     return df
@@ -134,7 +190,11 @@ def extract_categories_from_html(html: str) -> list[dict]:
     Devuelve: [{name, slug, cat_id, url}]
     """
     base_url = "https://www.carrefour.es"
-    soup = BeautifulSoup(html, "html.parser")
+    # bs4 is only needed here and as a fallback below; importing it lazily keeps
+    # it off the import path of every spawned extraction worker
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
     nav = soup.find("nav", class_="home-food-view__category-SEO-links")
     links = nav.select("a[href]") if nav else []
     out = []
@@ -148,7 +208,7 @@ def extract_categories_from_html(html: str) -> list[dict]:
         path = urlparse(href).path.strip("/")
         parts = [p for p in path.split("/") if p]
         slug = parts[1] if len(parts) > 1 else (parts[0] if parts else "")
-        m = re.search(r"(cat\d+)", href)
+        m = _CAT_ID_RE.search(href)
         cat_id = m.group(1) if m else ""
         out.append({"name": name, "slug": slug, "cat_id": cat_id, "url": url})
     return out
@@ -160,12 +220,15 @@ def extract_category_slugs_from_html(html: str) -> list[str]:
     return sorted({c["slug"].lower() for c in cats if c.get("slug")})
 
 
-def extract_products_from_html_files(raw_data_dir: str = None) -> pl.DataFrame:
+def extract_products_from_html_files(
+    raw_data_dir: str = None, max_workers: int = None
+) -> pl.DataFrame:
     """
     Extract products from all HTML files in the raw_data directory.
 
     Args:
         raw_data_dir: Directory containing HTML files. If None, uses default directory.
+        max_workers: Number of worker processes. If None, uses one per CPU.
 
     Returns:
         pl.DataFrame: DataFrame with extracted products
@@ -177,82 +240,164 @@ def extract_products_from_html_files(raw_data_dir: str = None) -> pl.DataFrame:
         logging.error("Raw data directory not found: %s", raw_data_dir)
         raise FileNotFoundError(f"Raw data directory not found: {raw_data_dir}")
 
-    all_products = []
     html_files = list(Path(raw_data_dir).glob("*.html"))
 
     logging.info("Found %d HTML files to process", len(html_files))
 
-    for html_file in html_files:
-        try:
-            logging.info("Processing file: %s", html_file.name)
-            products = extract_products_from_single_html(html_file)
-            all_products.extend(products)
-            logging.info(
-                "Extracted %d products from file %s", len(products), html_file.name
-            )
-        except Exception as e:
-            logging.error("Error processing file %s: %s", html_file.name, e)
-            continue
-
-    if not all_products:
+    if not html_files:
         logging.warning("No products found in any HTML file")
         return pl.DataFrame()
 
+    # One frame per file: each file's column lists are converted to Arrow as soon
+    # as they arrive and then dropped, instead of growing one set of Python lists
+    # for the whole catalog
+    frames = []
+
+    # Files are independent and parsing is CPU-bound, so spread them over worker
+    # processes. Workers are spawned (not forked) so each one starts its own
+    # logging listener, configured at the parent's level
+    workers = min(max_workers or os.cpu_count() or 1, len(html_files))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=configure_logging,
+        initargs=(logging.getLogger().isEnabledFor(logging.DEBUG),),
+    ) as executor:
+        pending = deque(
+            (html_file, executor.submit(extract_products_from_single_html, html_file))
+            for html_file in html_files
+        )
+
+        # Collect in file order so the first-wins deduplication stays deterministic;
+        # popping releases each result once it has been converted
+        while pending:
+            html_file, future = pending.popleft()
+            try:
+                logging.info("Processing file: %s", html_file.name)
+                products = future.result()
+                frames.append(pl.DataFrame(products, schema=_PRODUCT_SCHEMA))
+                logging.info(
+                    "Extracted %d products from file %s",
+                    frames[-1].height,
+                    html_file.name,
+                )
+            except Exception as e:
+                logging.error("Error processing file %s: %s", html_file.name, e)
+                continue
+
     # Create DataFrame and remove duplicates
-    df = pl.DataFrame(all_products)
+    df = pl.concat(frames, rechunk=True) if frames else pl.DataFrame()
+    if df.height == 0:
+        logging.warning("No products found in any HTML file")
+        return pl.DataFrame()
 
-    # Remove duplicates based on name and supermarket
-    df = df.unique(subset=["name", "supermarket"], keep="first")
+    # Remove duplicates based on name and supermarket. Every row here has
+    # supermarket == "carrefour", so the name alone is the same key and polars
+    # hashes/compares one string column instead of two
+    df = df.unique(subset=["name"], keep="first")
 
     logging.info("Total unique products extracted: %d", df.height)
     return df
 
 
-def extract_products_from_single_html(html_file_path: Path) -> list[dict]:
+def _product_card_links(html_content: bytes) -> list[tuple[str, str]]:
     """
-    Extract products from a single HTML file.
+    Find the (text, href) of the link in every <h2 class="product-card__title">.
+
+    Product cards render as a flat `<h2 ...><a href="...">name</a>`, so a regex
+    finds them without building a document tree. Pages where it doesn't match
+    every card title (e.g. a changed markup, or link text with nested tags) fall
+    back to parsing the HTML with BeautifulSoup.
 
     Args:
-        html_file_path: Path to the HTML file
+        html_content: UTF-8 HTML of a product listing page (bytes or a buffer such
+            as an mmap); only the matched links are decoded
 
     Returns:
-        list[dict]: List of extracted products
+        list[tuple[str, str]]: Stripped link text and href, in document order
     """
-    try:
-        with open(html_file_path, "r", encoding="utf-8") as file:
-            html_content = file.read()
-
-        # Search for the JavaScript 'impressions' array that contains the products
-        impressions_match = re.search(
-            r'window\["impressions"\]\s*=\s*(\[.*?\]);', html_content, re.DOTALL
+    matches = _PRODUCT_CARD_RE.findall(html_content)
+    if matches:
+        titles = sum(1 for _ in _PRODUCT_CARD_TITLE_RE.finditer(html_content))
+        if len(matches) == titles:
+            return [
+                (
+                    unescape(text.decode("utf-8")).strip(),
+                    unescape(href.decode("utf-8")).strip(),
+                )
+                for href, text in matches
+            ]
+        logging.info(
+            "Matched %d of %d product card links, parsing the page instead",
+            len(matches),
+            titles,
         )
 
-        if not impressions_match:
-            logging.warning("Array 'impressions' not found in %s", html_file_path.name)
-            return []
+    from bs4 import BeautifulSoup
+
+    links = []
+
+    soup = BeautifulSoup(html_content[:], "lxml", from_encoding="utf-8")
+    for h2 in soup.find_all("h2", class_="product-card__title"):
+        a_tag = h2.find("a")
+        if a_tag:
+            links.append(
+                (
+                    (a_tag.get_text(strip=True) or "").strip(),
+                    (a_tag.get("href") or "").strip(),
+                )
+            )
+    return links
+
 
-        # Extract and parse JSON
-        impressions_json = impressions_match.group(1)
-        products_data = json.loads(impressions_json)
+def extract_products_from_single_html(html_file_path: Path) -> dict[str, list]:
+    """
+    Extract products from a single HTML file.
+
+    Args:
+        html_file_path: Path to the HTML file
+
+    Returns:
+        dict[str, list]: Extracted products as one list per column (see _PRODUCT_SCHEMA);
+        every list is empty if the file has no products or can't be parsed
+    """
+    try:
+        # Map the file instead of decoding it into a str: the regexes scan the raw
+        # bytes and only the pieces they capture are copied out
+        with open(html_file_path, "rb") as file:
+            # An empty (e.g. truncated) capture can't be mapped and has no
+            # products either: report it like any page without them
+            if os.fstat(file.fileno()).st_size == 0:
+                logging.warning(
+                    "Array 'impressions' not found in %s", html_file_path.name
+                )
+                return {column: [] for column in _PRODUCT_SCHEMA}
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as html_content:
+                # Search for the JavaScript 'impressions' array that contains the products
+                impressions_match = _IMPRESSIONS_RE.search(html_content)
+
+                if not impressions_match:
+                    logging.warning(
+                        "Array 'impressions' not found in %s", html_file_path.name
+                    )
+                    return {column: [] for column in _PRODUCT_SCHEMA}
+
+                # Extract and parse JSON (orjson reads the UTF-8 bytes directly)
+                impressions_json = impressions_match.group(1)
+                products_data = orjson.loads(impressions_json)
+
+                product_links = _product_card_links(html_content)
 
         # Extract category information from filename
         filename = html_file_path.name
         category = extract_category_from_filename(filename)
 
-        # Parse HTML and build a map from slug (in href) to {name, url}
-        soup = BeautifulSoup(html_content, "html.parser")
-        product_links = soup.find_all("h2", class_="product-card__title")
-
+        # Build a map from slug (in href) to {name, url}
         # slug -> {"name": human_text, "url": href}
         product_map: dict[str, dict[str, str]] = {}
 
-        for h2 in product_links:
-            a_tag = h2.find("a")
-            if not a_tag:
-                continue
-
-            human_text = (a_tag.get_text(strip=True) or "").strip()
-            href = (a_tag.get("href") or "").strip()
+        for human_text, href in product_links:
             if not human_text or not href:
                 continue
 
@@ -268,7 +413,11 @@ def extract_products_from_single_html(html_file_path: Path) -> list[dict]:
             if slug and slug not in product_map:
                 product_map[slug] = {"name": human_text, "url": href}
 
-        products: list[dict] = []
+        discount_values = []
+        prices = []
+        prices_per_unit = []
+        names = []
+        urls = []
 
         for product in products_data:
             # JSON gives the slug in 'item_name' (e.g., 'toallitas-humedas-higienicas-infantiles-carrefour-soft-100-ud')
@@ -283,29 +432,34 @@ def extract_products_from_single_html(html_file_path: Path) -> list[dict]:
             if not human_name and json_slug:
                 human_name = json_slug.replace("-", " ").strip().capitalize()
 
-            clean_product = {
-                "discount_value": str(product.get("coupon", "")),
-                "price": float(product.get("price", 0.0)),
-                "price_per_unit": str(product.get("item_variant", "")),
-                "name": human_name,  # texto del <a>
-                "image": "",  # no disponible aquí
-                "url": product_url,  # href del <a> (relativa)
-                "supermarket": "carrefour",
-                "source_file": filename,
-                "extracted_category": category,
-            }
-            products.append(clean_product)
-
-        return products
-
-    except json.JSONDecodeError as e:
+            discount_values.append(str(product.get("coupon", "")))
+            prices.append(float(product.get("price", 0.0)))
+            prices_per_unit.append(str(product.get("item_variant", "")))
+            names.append(human_name)  # texto del <a>
+            urls.append(product_url)  # href del <a> (relativa)
+
+        count = len(names)
+        return {
+            "discount_value": discount_values,
+            "price": prices,
+            "price_per_unit": prices_per_unit,
+            "name": names,
+            "image": [""] * count,  # no disponible aquí
+            "url": urls,
+            "supermarket": ["carrefour"] * count,
+            "source_file": [filename] * count,
+            "extracted_category": [category] * count,
+        }
+
+    except orjson.JSONDecodeError as e:
         logging.error("Error parsing JSON products in %s: %s", html_file_path.name, e)
-        return []
+        return {column: [] for column in _PRODUCT_SCHEMA}
     except Exception as e:
         logging.error("Unexpected error processing %s: %s", html_file_path.name, e)
-        return []
+        return {column: [] for column in _PRODUCT_SCHEMA}
 
 
+@lru_cache(maxsize=1024)
 def extract_category_from_filename(filename: str) -> str:
     """
     Extract category from HTML filename.
@@ -316,32 +470,11 @@ def extract_category_from_filename(filename: str) -> str:
     Returns:
         str: Category extracted from filename
     """
-    # Mapping of filename patterns to readable categories
-    category_mapping = {
-        "productos-frescos": "Productos Frescos",
-        "la-despensa": "La Despensa",
-        "parafarmacia": "Parafarmacia",
-        "mascotas": "Mascotas",
-        "bebe": "Bebé",
-    }
-
-    for key, value in category_mapping.items():
-        if key in filename.lower():
-            return value
-
-    # If no match, extract from filename
-    if "cat20002" in filename:
-        return "Productos Frescos"
-    elif "cat20001" in filename:
-        return "La Despensa"
-    elif "cat20008" in filename:
-        return "Parafarmacia"
-    elif "cat20007" in filename:
-        return "Mascotas"
-    elif "cat20006" in filename:
-        return "Bebé"
-
-    return "Unknown"
+    # A category slug (any case) or, failing that, its category id
+    match = _CATEGORY_TOKEN_RE.search(filename)
+    if not match:
+        return "Unknown"
+    return _CATEGORY_BY_TOKEN[(match.group(1) or match.group(2)).lower()]
 
 
 def get_product_statistics(df: pl.DataFrame) -> dict:
@@ -357,19 +490,37 @@ def get_product_statistics(df: pl.DataFrame) -> dict:
     if df.height == 0:
         return {"total_products": 0}
 
+    # Every scalar aggregate in one lazy query, so polars computes them together
+    totals = (
+        df.lazy()
+        .select(
+            pl.len().alias("total_products"),
+            pl.col("extracted_category").n_unique().alias("total_categories"),
+            pl.col("price").min().alias("price_min"),
+            pl.col("price").max().alias("price_max"),
+            pl.col("price").mean().alias("price_avg"),
+            (pl.col("discount_value") != "").sum().alias("discounts_count"),
+            pl.col("source_file").n_unique().alias("files_processed"),
+        )
+        .collect()
+        .row(0, named=True)
+    )
+
     stats = {
-        "total_products": df.height,
-        "total_categories": df["extracted_category"].n_unique(),
-        "categories": df.group_by("extracted_category")
-        .agg(pl.count().alias("count"))
+        "total_products": totals["total_products"],
+        "total_categories": totals["total_categories"],
+        "categories": df.lazy()
+        .group_by("extracted_category")
+        .agg(pl.len().alias("count"))
+        .collect()
         .to_dicts(),
         "price_range": {
-            "min": float(df["price"].min()),
-            "max": float(df["price"].max()),
-            "avg": float(df["price"].mean()),
+            "min": float(totals["price_min"]),
+            "max": float(totals["price_max"]),
+            "avg": float(totals["price_avg"]),
         },
-        "discounts_count": df.filter(pl.col("discount_value") != "").height,
-        "files_processed": df["source_file"].n_unique(),
+        "discounts_count": totals["discounts_count"],
+        "files_processed": totals["files_processed"],
     }
 
     return stats
@@ -1,19 +1,115 @@
-# Add the parent directory to the sys.path
-import sys
 from os.path import dirname, abspath
 import os
 import logging
+import re
 import polars as pl
-from datetime import datetime
-from utils.postgres import execute_query
+from datetime import datetime, timedelta
+from utils.postgres import execute_query, load_rows, transaction
 
 
-sys.path.append(dirname(dirname(abspath(__file__))))
+# Output directory for JSON dumps (carrefour/data), resolved once at import
+_DATA_DIR = os.path.join(dirname(abspath(__file__)), "data")
+
+# Raw table names are interpolated into SQL as identifiers, so only the
+# date-based names the raw loaders create are accepted
+_RAW_SUPERMARKET_TABLE_RE = re.compile(r"supermarket_\d{8}")
+_RAW_PRODUCTS_TABLE_RE = re.compile(r"products_\d{8}")
+
+# Raw columns parsed to numbers in polars and stored as DOUBLE PRECISION even
+# when extracted as text, so staging reads them as-is instead of regex-checking
+# and casting their text
+_RAW_DOUBLE_COLUMNS = ("latitude", "longitude", "price")
+
+
+def _raw_frame(data: pl.DataFrame) -> tuple[pl.DataFrame, list[str]]:
+    """
+    Cast a frame for loading into a raw table, typing columns by polars dtype.
+
+    Float columns (and the known numeric raw columns) become Float64 and
+    DOUBLE PRECISION, with unparseable and non-finite values (NaN, inf) as null;
+    integer columns become Int64 and BIGINT; every other column becomes text.
+
+    Parameters:
+    - data (pl.DataFrame): Raw data to load
+
+    Returns:
+    - tuple[pl.DataFrame, list[str]]: The cast frame and its column definitions
+    """
+    doubles = [
+        col
+        for col, dtype in data.schema.items()
+        if col in _RAW_DOUBLE_COLUMNS or dtype.is_float()
+    ]
+    integers = [
+        col
+        for col, dtype in data.schema.items()
+        if dtype.is_integer() and col not in doubles
+    ]
+    data = data.with_columns(
+        pl.all().exclude(doubles + integers).cast(pl.Utf8, strict=False),
+        pl.col(integers).cast(pl.Int64, strict=False),
+        *(
+            pl.when(pl.col(col).cast(pl.Float64, strict=False).is_finite()).then(
+                pl.col(col).cast(pl.Float64, strict=False)
+            )
+            for col in doubles
+        ),
+    )
+    sql_types = {col: "DOUBLE PRECISION" for col in doubles}
+    sql_types.update({col: "BIGINT" for col in integers})
+    column_definitions = [
+        f'"{col}" {sql_types.get(col, "TEXT")}' for col in data.columns
+    ]
+    return data, column_definitions
+
+
+def _raw_numeric_casts(
+    raw_table_name: str, casts: dict[str, tuple[str, str]]
+) -> dict[str, str]:
+    """
+    Build the staging expressions that cast numeric raw columns.
+
+    Raw tables created by `_raw_frame` store these columns as DOUBLE PRECISION,
+    so they are cast as-is. Raw tables loaded as text by earlier versions are
+    still accepted: their values are regex-checked first, so a malformed value
+    becomes NULL instead of aborting the whole load.
+
+    Parameters:
+    - raw_table_name (str): Name of the raw table, in the raw schema
+    - casts (dict[str, tuple[str, str]]): Column -> (SQL type, regex a text
+      value must match to be cast)
+
+    Returns:
+    - dict[str, str]: Column -> SQL expression
+    """
+    text_columns = {
+        row["column_name"]
+        for row in execute_query(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'raw' AND table_name = %s AND data_type = 'text';
+            """,
+            (raw_table_name,),
+        )
+    }
+    return {
+        col: (
+            f"CASE WHEN {col} ~ '{pattern}' THEN CAST({col} AS {sql_type}) ELSE NULL END"
+            if col in text_columns
+            else f"CAST({col} AS {sql_type})"
+        )
+        for col, (sql_type, pattern) in casts.items()
+    }
 
 
 def load_data(data: pl.DataFrame, file_name: str) -> None:
     """
-    Load Carrefour data on a JSON file
+    Load Carrefour data on a NDJSON file
+
+    One JSON object is written per row, so the file can be read back in a
+    streaming fashion with `pl.read_ndjson`/`pl.scan_ndjson`. The file is
+    written next to `file_name` with its extension replaced by `.ndjson`
+    (e.g. supermarkets.json -> supermarkets.ndjson).
 
     Parameters:
     - data (pl.DataFrame): Carrefour data.
@@ -22,12 +118,13 @@ def load_data(data: pl.DataFrame, file_name: str) -> None:
     Returns:
     - None
     """
-    output_directory = dirname(dirname(abspath(__file__))) + "/carrefour/data"
-    os.makedirs(output_directory, exist_ok=True)
-    output_path = os.path.join(output_directory, file_name)
+    os.makedirs(_DATA_DIR, exist_ok=True)
+    file_name = os.path.splitext(file_name)[0] + ".ndjson"
+    output_path = os.path.join(_DATA_DIR, file_name)
     logging.info("Saving Carrefour supermarkets metadata into file: %s", file_name)
-    with open(output_path, "w", encoding="utf-8") as file:
-        data.write_json(file)
+    # Given a path, polars writes the rows with its own buffered writer instead
+    # of building the whole JSON array and pushing it through a Python text handle
+    data.write_ndjson(output_path)
     logging.info("Carrefour supermarkets metadata saved into file: %s", file_name)
 
 
@@ -36,7 +133,9 @@ def load_raw_data_to_postgres(data: pl.DataFrame) -> None:
     Load raw supermarkets data to PostgreSQL with date-based table naming.
 
     Creates a table with format: raw.supermarket_YYYYMMDD
-    Each DataFrame column becomes a text column in PostgreSQL.
+    Float and integer DataFrame columns (latitude and longitude included)
+    become DOUBLE PRECISION and BIGINT columns in PostgreSQL, every other
+    column a text column.
     If table exists, it will be replaced to avoid duplicates.
 
     Parameters:
@@ -53,40 +152,30 @@ def load_raw_data_to_postgres(data: pl.DataFrame) -> None:
     logging.info("Creating raw data table: %s", full_table_name)
 
     # Get DataFrame columns and create table columns
+    data, column_definitions = _raw_frame(data)
     columns = data.columns
-    column_definitions = [f'"{col}" TEXT' for col in columns]
 
-    # Drop table if exists and recreate to avoid duplicates
+    # Drop table if exists and recreate to avoid duplicates. Raw tables are a
+    # one-shot load that can be re-extracted, so they're UNLOGGED: the COPY skips
+    # WAL entirely, at the cost of the table being emptied after a crash
     drop_table_query = f"DROP TABLE IF EXISTS {full_table_name};"
     create_table_query = f"""
-    CREATE TABLE {full_table_name} (
+    CREATE UNLOGGED TABLE {full_table_name} (
         {", ".join(column_definitions)}
     );
     """
 
     try:
-        # Drop existing table and recreate
-        execute_query(drop_table_query, fetch=False)
-        execute_query(create_table_query, fetch=False)
-
-        logging.info("Raw data table created successfully")
+        # Replace the table and load it in one transaction on a single connection
+        with transaction() as cursor:
+            cursor.execute(drop_table_query)
+            cursor.execute(create_table_query)
 
-        # Insert data row by row
-        for row in data.iter_rows(named=True):
-            # Create placeholders for each column
-            placeholders = ", ".join(["%s"] * len(columns))
-            column_names = ", ".join([f'"{col}"' for col in columns])
+            logging.info("Raw data table created successfully")
 
-            insert_query = f"""
-            INSERT INTO {full_table_name} ({column_names}) 
-            VALUES ({placeholders});
-            """
-
-            # Get values in the same order as columns
-            values = [
-                str(row[col]) if row[col] is not None else None for col in columns
-            ]
-            execute_query(insert_query, values, fetch=False)
+            # Stream every row in a single binary COPY, or batched INSERTs where
+            # COPY isn't allowed; values were cast once, vectorized in polars
+            load_rows(cursor, full_table_name, columns, data.rows())
 
         logging.info(
             "Raw data loaded to PostgreSQL successfully in table: %s", full_table_name
@@ -120,23 +209,21 @@ def create_staging_supermarkets_table() -> None:
     ) PARTITION BY RANGE (extracted_date);
     """
 
-    execute_query(create_staging_table_query, fetch=False)
-
     # Create indexes for better performance
     create_indexes_query = """
     CREATE INDEX IF NOT EXISTS idx_staging_supermarkets_extracted_date ON staging.supermarkets(extracted_date);
     CREATE INDEX IF NOT EXISTS idx_staging_supermarkets_location ON staging.supermarkets(latitude, longitude);
     CREATE INDEX IF NOT EXISTS idx_staging_supermarkets_name ON staging.supermarkets(name);
     CREATE INDEX IF NOT EXISTS idx_staging_supermarkets_store_id ON staging.supermarkets(store_id);
+    -- Matches the per-location ranking done when promoting a date to production
+    CREATE INDEX IF NOT EXISTS idx_staging_supermarkets_dedup ON staging.supermarkets(extracted_date, latitude, longitude, name, store_id DESC NULLS LAST);
     """
 
-    execute_query(create_indexes_query, fetch=False)
-
-    logging.info("Staging supermarkets table created successfully")
-
     try:
-        execute_query(create_staging_table_query, fetch=False)
-        execute_query(create_indexes_query, fetch=False)
+        # Table and indexes in a single round trip
+        execute_query(
+            "\n".join([create_staging_table_query, create_indexes_query]), fetch=False
+        )
         logging.info("Staging supermarkets table created successfully")
     except Exception as e:
         logging.error("Error creating staging table: %s", e)
@@ -167,8 +254,6 @@ def create_prod_supermarkets_table() -> None:
     ) PARTITION BY RANGE (extracted_date);
     """
 
-    execute_query(create_prod_table_query, fetch=False)
-
     # Add unique constraint if it doesn't exist (based on store_id, date and name)
     add_unique_constraint_query = """
     DO $$ 
@@ -184,18 +269,29 @@ def create_prod_supermarkets_table() -> None:
     END $$;
     """
 
-    execute_query(add_unique_constraint_query, fetch=False)
-
     # Create indexes for API performance
     create_prod_indexes_query = """
     CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_location ON prod.supermarkets(latitude, longitude);
-    CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_active ON prod.supermarkets(is_active);
+    -- Reads only ever want active rows: index those instead of the boolean itself
+    DROP INDEX IF EXISTS prod.idx_prod_supermarkets_active;
+    CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_active_extracted_date ON prod.supermarkets(extracted_date) WHERE is_active;
+    CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_active_name ON prod.supermarkets(name) WHERE is_active;
     CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_extracted_date ON prod.supermarkets(extracted_date);
     CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_name ON prod.supermarkets(name);
     CREATE INDEX IF NOT EXISTS idx_prod_supermarkets_store_id ON prod.supermarkets(store_id);
     """
 
-    execute_query(create_prod_indexes_query, fetch=False)
+    # Every statement in a single round trip
+    execute_query(
+        "\n".join(
+            [
+                create_prod_table_query,
+                add_unique_constraint_query,
+                create_prod_indexes_query,
+            ]
+        ),
+        fetch=False,
+    )
 
     logging.info("Production schema and table structure created successfully")
 
@@ -207,35 +303,42 @@ def load_staging_data_from_raw(raw_table_name: str) -> None:
     Parameters:
     - raw_table_name (str): Name of the raw table to consolidate
     """
-    logging.info(f"Loading staging data from raw.{raw_table_name}...")
+    logging.info("Loading staging data from raw.%s...", raw_table_name)
+
+    if not _RAW_SUPERMARKET_TABLE_RE.fullmatch(raw_table_name):
+        raise ValueError(f"Invalid raw supermarkets table name: {raw_table_name}")
 
-    # Get the extracted date from table name
+    # Get the extracted date from table name, parsed once; the DELETE/INSERT
+    # take it as a bind parameter
     extracted_date = raw_table_name.replace("supermarket_", "")
+    extracted_day = datetime.strptime(extracted_date, "%Y%m%d").date()
 
     # Create staging table if it doesn't exist
     create_staging_supermarkets_table()
 
-    # Create partition for the specific date if it doesn't exist
+    # Create partition for the specific date if it doesn't exist; both bounds
+    # are computed here so the statement only carries literal dates
     partition_name = f"supermarkets_{extracted_date}"
     create_partition_query = f"""
     CREATE TABLE IF NOT EXISTS staging.{partition_name} 
     PARTITION OF staging.supermarkets 
-    FOR VALUES FROM ('{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}') 
-    TO ('{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}'::date + INTERVAL '1 day');
+    FOR VALUES FROM ('{extracted_day}') 
+    TO ('{extracted_day + timedelta(days=1)}');
     """
 
-    execute_query(create_partition_query, fetch=False)
-
     # Delete existing data for this date to avoid duplicates
-    delete_existing_query = f"""
+    delete_existing_query = """
     DELETE FROM staging.supermarkets 
-    WHERE extracted_date = '{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}'::date
+    WHERE extracted_date = %(extracted_date)s
     AND name = 'carrefour';
     """
 
-    execute_query(delete_existing_query, fetch=False)
-    logging.info(
-        f"Deleted existing staging data for date: {extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}"
+    numeric = _raw_numeric_casts(
+        raw_table_name,
+        {
+            "latitude": ("DECIMAL(10, 8)", "^[0-9.-]+$"),
+            "longitude": ("DECIMAL(11, 8)", "^[0-9.-]+$"),
+        },
     )
 
     # Insert consolidated data into staging table
@@ -248,22 +351,33 @@ def load_staging_data_from_raw(raw_table_name: str) -> None:
         COALESCE(address, '') as address,
         COALESCE(schedule, '') as schedule,
         COALESCE(holidays, '') as holidays,
-        CASE 
-            WHEN latitude ~ '^[0-9.-]+$' THEN CAST(latitude AS DECIMAL(10, 8))
-            ELSE NULL 
-        END as latitude,
-        CASE 
-            WHEN longitude ~ '^[0-9.-]+$' THEN CAST(longitude AS DECIMAL(11, 8))
-            ELSE NULL 
-        END as longitude,
-        '{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}'::date as extracted_date,
+        {numeric["latitude"]} as latitude,
+        {numeric["longitude"]} as longitude,
+        %(extracted_date)s as extracted_date,
         'carrefour' as name
     FROM raw.{raw_table_name};
     """
 
-    execute_query(insert_staging_query, fetch=False)
+    # Refresh the planner statistics of the freshly replaced partition only
+    analyze_partition_query = f"ANALYZE staging.{partition_name};"
 
-    logging.info(f"Staging data loaded from raw.{raw_table_name} successfully")
+    # Send partition, delete, insert and analyze as one script: a single round
+    # trip, run as a single transaction
+    execute_query(
+        "\n".join(
+            [
+                create_partition_query,
+                delete_existing_query,
+                insert_staging_query,
+                analyze_partition_query,
+            ]
+        ),
+        {"extracted_date": extracted_day},
+        fetch=False,
+    )
+
+    logging.info("Replaced staging data for date: %s", extracted_day)
+    logging.info("Staging data loaded from raw.%s successfully", raw_table_name)
 
 
 def load_prod_data_from_staging() -> None:
@@ -294,21 +408,28 @@ def load_prod_data_from_staging() -> None:
     CREATE TABLE IF NOT EXISTS prod.{partition_name} 
     PARTITION OF prod.supermarkets 
     FOR VALUES FROM ('{latest_date}') 
-    TO ('{latest_date}'::date + INTERVAL '1 day');
+    TO ('{latest_date + timedelta(days=1)}');
     """
 
-    execute_query(create_partition_query, fetch=False)
-
+    # Keep one row per location, preferring the highest non-null store_id; the
+    # ranking walks the dedup index of the date's partition instead of sorting it
     upsert_query = """
+    WITH ranked AS (
+        SELECT
+            s.store_id, s.address, s.schedule, s.holidays, s.latitude, s.longitude, s.extracted_date, s.name,
+            row_number() OVER (
+                PARTITION BY s.latitude, s.longitude, s.name
+                ORDER BY s.store_id DESC NULLS LAST
+            ) AS rn
+        FROM staging.supermarkets s
+        WHERE s.extracted_date = %s AND s.name = 'carrefour'
+    )
     INSERT INTO prod.supermarkets (
         store_id, address, schedule, holidays, latitude, longitude, extracted_date, name
     )
-    SELECT DISTINCT ON (s.latitude, s.longitude, s.extracted_date, s.name)
-        s.store_id, s.address, s.schedule, s.holidays, s.latitude, s.longitude, s.extracted_date, s.name
-    FROM staging.supermarkets s
-    WHERE s.extracted_date = %s AND s.name = 'carrefour'
-    ORDER BY s.latitude, s.longitude, s.extracted_date, s.name,
-             (s.store_id IS NULL), s.store_id DESC
+    SELECT store_id, address, schedule, holidays, latitude, longitude, extracted_date, name
+    FROM ranked
+    WHERE rn = 1
     ON CONFLICT (latitude, longitude, extracted_date, name) DO UPDATE SET
         address = EXCLUDED.address,
         schedule = EXCLUDED.schedule,
@@ -317,7 +438,10 @@ def load_prod_data_from_staging() -> None:
         last_updated = NOW();
     """
 
-    execute_query(upsert_query, (latest_date,), fetch=False)
+    # Create the partition and upsert into it in a single round trip
+    execute_query(
+        "\n".join([create_partition_query, upsert_query]), (latest_date,), fetch=False
+    )
 
     logging.info("Production data loaded from staging successfully")
 
@@ -327,7 +451,8 @@ def load_products_raw_data_to_postgres(data: pl.DataFrame) -> None:
     Load raw products data to PostgreSQL with date-based table naming.
 
     Creates a table with format: raw.products_YYYYMMDD
-    Each DataFrame column becomes a text column in PostgreSQL.
+    Float and integer DataFrame columns (the price included) become DOUBLE
+    PRECISION and BIGINT columns in PostgreSQL, every other column a text column.
     If table exists, it will be replaced to avoid duplicates.
 
     Parameters:
@@ -344,40 +469,30 @@ def load_products_raw_data_to_postgres(data: pl.DataFrame) -> None:
     logging.info("Creating raw products table: %s", full_table_name)
 
     # Get DataFrame columns and create table columns
+    data, column_definitions = _raw_frame(data)
     columns = data.columns
-    column_definitions = [f'"{col}" TEXT' for col in columns]
 
-    # Drop table if exists and recreate to avoid duplicates
+    # Drop table if exists and recreate to avoid duplicates. Raw tables are a
+    # one-shot load that can be re-extracted, so they're UNLOGGED: the COPY skips
+    # WAL entirely, at the cost of the table being emptied after a crash
     drop_table_query = f"DROP TABLE IF EXISTS {full_table_name};"
     create_table_query = f"""
-    CREATE TABLE {full_table_name} (
+    CREATE UNLOGGED TABLE {full_table_name} (
         {", ".join(column_definitions)}
     );
     """
 
     try:
-        # Drop existing table and recreate
-        execute_query(drop_table_query, fetch=False)
-        execute_query(create_table_query, fetch=False)
+        # Replace the table and load it in one transaction on a single connection
+        with transaction() as cursor:
+            cursor.execute(drop_table_query)
+            cursor.execute(create_table_query)
 
-        logging.info("Raw products table created successfully")
+            logging.info("Raw products table created successfully")
 
-        # Insert data row by row
-        for row in data.iter_rows(named=True):
-            # Create placeholders for each column
-            placeholders = ", ".join(["%s"] * len(columns))
-            column_names = ", ".join([f'"{col}"' for col in columns])
-
-            insert_query = f"""
-            INSERT INTO {full_table_name} ({column_names}) 
-            VALUES ({placeholders});
-            """
-
-            # Get values in the same order as columns
-            values = [
-                str(row[col]) if row[col] is not None else None for col in columns
-            ]
-            execute_query(insert_query, values, fetch=False)
+            # Stream every row in a single binary COPY, or batched INSERTs where
+            # COPY isn't allowed; values were cast once, vectorized in polars
+            load_rows(cursor, full_table_name, columns, data.rows())
 
         logging.info(
             "Raw products data loaded to PostgreSQL successfully in table: %s",
@@ -415,17 +530,21 @@ def create_staging_products_table() -> None:
     ) PARTITION BY RANGE (extracted_date);
     """
 
-    execute_query(create_staging_table_query, fetch=False)
-
     # Create indexes for better performance
     create_indexes_query = """
     CREATE INDEX IF NOT EXISTS idx_staging_products_extracted_date ON staging.products(extracted_date);
     CREATE INDEX IF NOT EXISTS idx_staging_products_name ON staging.products(name);
     CREATE INDEX IF NOT EXISTS idx_staging_products_supermarket ON staging.products(supermarket);
     CREATE INDEX IF NOT EXISTS idx_staging_products_price ON staging.products(price);
+    -- Matches the per-product ranking done when promoting a date to production
+    CREATE INDEX IF NOT EXISTS idx_staging_products_dedup ON staging.products(extracted_date, name, supermarket);
     """
 
-    execute_query(create_indexes_query, fetch=False)
+    # Every statement in a single round trip
+    execute_query(
+        "\n".join([create_staging_table_query, create_indexes_query]),
+        fetch=False,
+    )
 
     logging.info("Staging products table created successfully")
 
@@ -457,8 +576,6 @@ def create_prod_products_table() -> None:
     ) PARTITION BY RANGE (extracted_date);
     """
 
-    execute_query(create_prod_table_query, fetch=False)
-
     # Add unique constraint if it doesn't exist (based on name, supermarket and extracted_date)
     add_unique_constraint_query = """
     DO $$ 
@@ -474,18 +591,34 @@ def create_prod_products_table() -> None:
     END $$;
     """
 
-    execute_query(add_unique_constraint_query, fetch=False)
-
     # Create indexes for API performance
     create_prod_indexes_query = """
     CREATE INDEX IF NOT EXISTS idx_prod_products_extracted_date ON prod.products(extracted_date);
-    CREATE INDEX IF NOT EXISTS idx_prod_products_active ON prod.products(is_active);
+    -- Reads only ever want active rows: index those instead of the boolean itself
+    DROP INDEX IF EXISTS prod.idx_prod_products_active;
+    CREATE INDEX IF NOT EXISTS idx_prod_products_active_extracted_date ON prod.products(extracted_date) WHERE is_active;
+    CREATE INDEX IF NOT EXISTS idx_prod_products_active_supermarket ON prod.products(supermarket) WHERE is_active;
     CREATE INDEX IF NOT EXISTS idx_prod_products_name ON prod.products(name);
     CREATE INDEX IF NOT EXISTS idx_prod_products_supermarket ON prod.products(supermarket);
     CREATE INDEX IF NOT EXISTS idx_prod_products_price ON prod.products(price);
     """
 
-    execute_query(create_prod_indexes_query, fetch=False)
+    # prod.products_stats was a materialized view of these statistics that
+    # nothing read; drop it where an earlier deploy created it
+    drop_stats_view_query = "DROP MATERIALIZED VIEW IF EXISTS prod.products_stats;"
+
+    # Every statement in a single round trip
+    execute_query(
+        "\n".join(
+            [
+                create_prod_table_query,
+                add_unique_constraint_query,
+                create_prod_indexes_query,
+                drop_stats_view_query,
+            ]
+        ),
+        fetch=False,
+    )
 
     logging.info("Production products schema and table structure created successfully")
 
@@ -500,34 +633,37 @@ def load_staging_products_from_raw(raw_table_name: str) -> None:
     Returns:
         None
     """
-    logging.info(f"Loading staging products data from raw.{raw_table_name}...")
+    logging.info("Loading staging products data from raw.%s...", raw_table_name)
+
+    if not _RAW_PRODUCTS_TABLE_RE.fullmatch(raw_table_name):
+        raise ValueError(f"Invalid raw products table name: {raw_table_name}")
 
-    # Get the extracted date from table name
+    # Get the extracted date from table name, parsed once; the DELETE/INSERT
+    # take it as a bind parameter
     extracted_date = raw_table_name.replace("products_", "")
+    extracted_day = datetime.strptime(extracted_date, "%Y%m%d").date()
 
     # Create staging table if it doesn't exist
     create_staging_products_table()
 
-    # Create partition for the specific date if it doesn't exist
+    # Create partition for the specific date if it doesn't exist; both bounds
+    # are computed here so the statement only carries literal dates
     partition_name = f"products_{extracted_date}"
     create_partition_query = f"""
     CREATE TABLE IF NOT EXISTS staging.{partition_name} 
     PARTITION OF staging.products 
-    FOR VALUES FROM ('{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}') 
-    TO ('{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}'::date + INTERVAL '1 day');
+    FOR VALUES FROM ('{extracted_day}') 
+    TO ('{extracted_day + timedelta(days=1)}');
     """
 
-    execute_query(create_partition_query, fetch=False)
-
     # Delete existing data for this date to avoid duplicates
-    delete_existing_query = f"""
+    delete_existing_query = """
     DELETE FROM staging.products 
-    WHERE extracted_date = '{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}'::date;
+    WHERE extracted_date = %(extracted_date)s;
     """
 
-    execute_query(delete_existing_query, fetch=False)
-    logging.info(
-        f"Deleted existing staging products data for date: {extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}"
+    numeric = _raw_numeric_casts(
+        raw_table_name, {"price": ("DECIMAL(10, 2)", "^[0-9.]+$")}
     )
 
     # Insert consolidated data into staging table
@@ -537,22 +673,38 @@ def load_staging_products_from_raw(raw_table_name: str) -> None:
     )
     SELECT 
         COALESCE(discount_value, '') as discount_value,
-        CASE 
-            WHEN price ~ '^[0-9.]+$' THEN CAST(price AS DECIMAL(10, 2))
-            ELSE NULL 
-        END as price,
+        {numeric["price"]} as price,
         COALESCE(price_per_unit, '') as price_per_unit,
         COALESCE(name, '') as name,
         '' as image,
         '' as url,
         'carrefour' as supermarket,
-        '{extracted_date[:4]}-{extracted_date[4:6]}-{extracted_date[6:8]}'::date as extracted_date
+        %(extracted_date)s as extracted_date
     FROM raw.{raw_table_name};
     """
 
-    execute_query(insert_staging_query, fetch=False)
+    # Refresh the planner statistics of the freshly replaced partition only
+    analyze_partition_query = f"ANALYZE staging.{partition_name};"
+
+    # Send partition, delete, insert and analyze as one script: a single round
+    # trip, run as a single transaction
+    execute_query(
+        "\n".join(
+            [
+                create_partition_query,
+                delete_existing_query,
+                insert_staging_query,
+                analyze_partition_query,
+            ]
+        ),
+        {"extracted_date": extracted_day},
+        fetch=False,
+    )
 
-    logging.info(f"Staging products data loaded from raw.{raw_table_name} successfully")
+    logging.info("Replaced staging products data for date: %s", extracted_day)
+    logging.info(
+        "Staging products data loaded from raw.%s successfully", raw_table_name
+    )
 
 
 def load_prod_products_from_staging() -> None:
@@ -586,20 +738,25 @@ def load_prod_products_from_staging() -> None:
     CREATE TABLE IF NOT EXISTS prod.{partition_name} 
     PARTITION OF prod.products 
     FOR VALUES FROM ('{latest_date}') 
-    TO ('{latest_date}'::date + INTERVAL '1 day');
+    TO ('{latest_date + timedelta(days=1)}');
     """
 
-    execute_query(create_partition_query, fetch=False)
-
+    # Keep one row per product; the ranking walks the dedup index of the date's
+    # partition instead of sorting it
     upsert_query = """
+    WITH ranked AS (
+        SELECT
+            s.discount_value, s.price, s.price_per_unit, s.name, s.image, s.url, s.supermarket, s.extracted_date,
+            row_number() OVER (PARTITION BY s.name, s.supermarket) AS rn
+        FROM staging.products s
+        WHERE s.extracted_date = %s
+    )
     INSERT INTO prod.products (
         discount_value, price, price_per_unit, name, image, url, supermarket, extracted_date
     )
-    SELECT DISTINCT ON (s.name, s.supermarket, s.extracted_date)
-        s.discount_value, s.price, s.price_per_unit, s.name, s.image, s.url, s.supermarket, s.extracted_date
-    FROM staging.products s
-    WHERE s.extracted_date = %s
-    ORDER BY s.name, s.supermarket, s.extracted_date
+    SELECT discount_value, price, price_per_unit, name, image, url, supermarket, extracted_date
+    FROM ranked
+    WHERE rn = 1
     ON CONFLICT (name, supermarket, extracted_date) DO UPDATE SET
         discount_value = EXCLUDED.discount_value,
         price = EXCLUDED.price,
@@ -609,7 +766,10 @@ def load_prod_products_from_staging() -> None:
         last_updated = NOW();
     """
 
-    execute_query(upsert_query, (latest_date,), fetch=False)
+    # Create the partition and upsert into it in a single round trip
+    execute_query(
+        "\n".join([create_partition_query, upsert_query]), (latest_date,), fetch=False
+    )
 
     logging.info("Production products data loaded from staging successfully")
 
@@ -622,68 +782,50 @@ def get_products_statistics() -> dict:
         dict: Dictionary with products statistics
     """
     try:
-        # Get total products count
-        total_count_query = (
-            "SELECT COUNT(*) as total FROM prod.products WHERE is_active = TRUE;"
-        )
-        total_result = execute_query(total_count_query)
-        total_products = total_result[0]["total"] if total_result else 0
-
-        # Get products by supermarket
-        supermarket_stats_query = """
-        SELECT supermarket, COUNT(*) as count 
-        FROM prod.products 
-        WHERE is_active = TRUE 
-        GROUP BY supermarket 
-        ORDER BY count DESC;
-        """
-        supermarket_stats = execute_query(supermarket_stats_query)
-
-        # Get price statistics
-        price_stats_query = """
-        SELECT 
-            MIN(price) as min_price,
-            MAX(price) as max_price,
-            AVG(price) as avg_price
-        FROM prod.products 
-        WHERE is_active = TRUE AND price IS NOT NULL;
-        """
-        price_stats = execute_query(price_stats_query)
-
-        # Get products with discounts count
-        discounts_count_query = """
-        SELECT COUNT(*) as discounts_count 
-        FROM prod.products 
-        WHERE is_active = TRUE AND discount_value != '';
-        """
-        discounts_result = execute_query(discounts_count_query)
-        discounts_count = (
-            discounts_result[0]["discounts_count"] if discounts_result else 0
-        )
-
-        # Get latest extraction date
-        latest_date_query = """
-        SELECT MAX(extracted_date) as latest_date 
+        # Every statistic in one scan and one round trip: counts and price range
+        # of active products, the latest extraction date over all of them, and
+        # the active products per supermarket as a JSON list
+        stats_query = """
+        SELECT
+            COUNT(*) FILTER (WHERE is_active = TRUE) as total,
+            MIN(price) FILTER (WHERE is_active = TRUE) as min_price,
+            MAX(price) FILTER (WHERE is_active = TRUE) as max_price,
+            AVG(price) FILTER (WHERE is_active = TRUE) as avg_price,
+            COUNT(*) FILTER (
+                WHERE is_active = TRUE AND discount_value != ''
+            ) as discounts_count,
+            MAX(extracted_date) as latest_date,
+            (
+                SELECT COALESCE(
+                    json_agg(
+                        json_build_object('supermarket', supermarket, 'count', count)
+                        ORDER BY count DESC
+                    ),
+                    '[]'
+                )
+                FROM (
+                    SELECT supermarket, COUNT(*) as count
+                    FROM prod.products
+                    WHERE is_active = TRUE
+                    GROUP BY supermarket
+                ) s
+            ) as supermarket_stats
         FROM prod.products;
         """
-        latest_date_result = execute_query(latest_date_query)
-        latest_date = (
-            latest_date_result[0]["latest_date"] if latest_date_result else None
-        )
+        stats_result = execute_query(stats_query)
+        stats = stats_result[0] if stats_result else {}
+        total_products = stats.get("total", 0)
+        supermarket_stats = stats.get("supermarket_stats", [])
+        discounts_count = stats.get("discounts_count", 0)
+        latest_date = stats.get("latest_date")
 
         return {
             "total_products": total_products,
             "supermarkets": supermarket_stats,
             "price_range": {
-                "min": float(price_stats[0]["min_price"])
-                if price_stats and price_stats[0]["min_price"]
-                else 0.0,
-                "max": float(price_stats[0]["max_price"])
-                if price_stats and price_stats[0]["max_price"]
-                else 0.0,
-                "avg": float(price_stats[0]["avg_price"])
-                if price_stats and price_stats[0]["avg_price"]
-                else 0.0,
+                "min": float(stats["min_price"]) if stats.get("min_price") else 0.0,
+                "max": float(stats["max_price"]) if stats.get("max_price") else 0.0,
+                "avg": float(stats["avg_price"]) if stats.get("avg_price") else 0.0,
             },
             "discounts_count": discounts_count,
             "latest_extraction_date": latest_date.isoformat() if latest_date else None,
@@ -4,10 +4,13 @@ import click
 import sys
 from os.path import abspath, dirname
 
-# Add the parent directory to the sys.path
-sys.path.append(dirname(dirname(abspath(__file__))))
+# Add the parent directory to the sys.path. This is the CLI entry point, so it's
+# the only module that needs it: extract/load and utils are imported after it
+_ROOT_DIR = dirname(dirname(abspath(__file__)))
+if _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
 
-from utils.postgres import close_pool, configure_products_search
+from utils.postgres import close_pool, configure_products_search, session
 from load import (
     load_raw_data_to_postgres,
     load_staging_data_from_raw,
@@ -25,19 +28,20 @@ from extract import extract_products_from_html_files, extract_supermarkets
 
 
 @click.group()
+@click.option("--debug", is_flag=True, help="Enable debug mode.")
 @click.pass_context
-def cli(ctx):
+def cli(ctx, debug):
     """Carrefour CLI Tool"""
     ctx.ensure_object(dict)
+    # Configure logging once for the whole invocation, before any group runs
+    configure_logging(debug)
 
 
 @cli.group()
-@click.option("--debug", is_flag=True, help="Enable debug mode.")
 @click.pass_context
-def supermarket(ctx, debug):
+def supermarket(ctx):
     """Supermarket data pipeline commands"""
     ctx.ensure_object(dict)
-    configure_logging(debug)
 
 
 @supermarket.command()
@@ -48,13 +52,13 @@ def extract_raw(ctx):
         logging.info("Extracting raw supermarkets data from Carrefour XML endpoint")
         df = extract_supermarkets()
 
-        logging.info(f"Found {len(df)} raw supermarkets records to load...")
+        logging.info("Found %d raw supermarkets records to load...", len(df))
 
         # Load raw data to PostgreSQL with date-based table naming
         load_raw_data_to_postgres(df)
 
     except Exception as e:
-        logging.error(f"Error loading raw data: {e}")
+        logging.error("Error loading raw data: %s", e)
         raise
     finally:
         close_pool()
@@ -79,7 +83,7 @@ def transform_staging(ctx):
         logging.info("Data transformed to staging successfully")
 
     except Exception as e:
-        logging.error(f"Error transforming to staging: {e}")
+        logging.error("Error transforming to staging: %s", e)
         raise
     finally:
         close_pool()
@@ -98,7 +102,7 @@ def deploy_prod(ctx):
         logging.info("Data deployed to production successfully")
 
     except Exception as e:
-        logging.error(f"Error deploying to production: {e}")
+        logging.error("Error deploying to production: %s", e)
         raise
     finally:
         close_pool()
@@ -114,7 +118,7 @@ def run_pipeline(ctx):
         # Step 1: Extract and load raw data
         logging.info("Step 1: Extracting and loading raw data")
         df = extract_supermarkets()
-        logging.info(f"Found {len(df)} raw supermarkets records to load...")
+        logging.info("Found %d raw supermarkets records to load...", len(df))
 
         # Generate table name for raw data
         from datetime import datetime
@@ -122,38 +126,38 @@ def run_pipeline(ctx):
         current_date = datetime.now().strftime("%Y%m%d")
         raw_table_name = f"supermarket_{current_date}"
 
-        # Load raw data to PostgreSQL
-        load_raw_data_to_postgres(df)
+        # Run every load step on one connection, as a single transaction
+        with session():
+            # Load raw data to PostgreSQL
+            load_raw_data_to_postgres(df)
 
-        # Step 2: Create schemas if they don't exist
-        logging.info("Step 2: Creating schemas and table structures")
-        create_staging_supermarkets_table()
-        create_prod_supermarkets_table()
+            # Step 2: Create schemas if they don't exist
+            logging.info("Step 2: Creating schemas and table structures")
+            create_staging_supermarkets_table()
+            create_prod_supermarkets_table()
 
-        # Step 3: Consolidate to staging
-        logging.info("Step 3: Transforming data to staging")
-        load_staging_data_from_raw(raw_table_name)
+            # Step 3: Consolidate to staging
+            logging.info("Step 3: Transforming data to staging")
+            load_staging_data_from_raw(raw_table_name)
 
-        # Step 4: Promote to production
-        logging.info("Step 4: Deploying data to production")
-        load_prod_data_from_staging()
+            # Step 4: Promote to production
+            logging.info("Step 4: Deploying data to production")
+            load_prod_data_from_staging()
 
         logging.info("Full data pipeline completed successfully!")
 
     except Exception as e:
-        logging.error(f"Error in full data pipeline: {e}")
+        logging.error("Error in full data pipeline: %s", e)
         raise
     finally:
         close_pool()
 
 
 @cli.group()
-@click.option("--debug", is_flag=True, help="Enable debug mode.")
 @click.pass_context
-def products(ctx, debug):
+def products(ctx):
     """Products data pipeline commands"""
     ctx.ensure_object(dict)
-    configure_logging(debug)
 
 
 @products.command()
@@ -162,7 +166,7 @@ def get_products(ctx):
     """Extract products from Carrefour website"""
     logging.info("Extracting products from Carrefour website")
     products = extract_products_from_html_files()
-    logging.info(f"Found {products.height} products")
+    logging.info("Found %d products", products.height)
     logging.info(products)
 
 
@@ -172,7 +176,7 @@ def run_products_pipeline(ctx):
     """Execute complete products data pipeline"""
     logging.info("Starting full products data pipeline execution")
     products = extract_products_from_html_files()
-    logging.info(f"Found {products.height} products")
+    logging.info("Found %d products", products.height)
 
     # Generate table name for raw data
     from datetime import datetime
@@ -182,21 +186,23 @@ def run_products_pipeline(ctx):
 
     logging.debug(products)
 
-    # Load raw data to PostgreSQL
-    load_products_raw_data_to_postgres(products)
+    # Run every load step on one connection, as a single transaction
+    with session():
+        # Load raw data to PostgreSQL
+        load_products_raw_data_to_postgres(products)
 
-    # Create schemas and table structures
-    logging.info("Creating schemas and table structures for products")
-    create_staging_products_table()
-    create_prod_products_table()
+        # Create schemas and table structures
+        logging.info("Creating schemas and table structures for products")
+        create_staging_products_table()
+        create_prod_products_table()
 
-    # Transform to staging
-    logging.info("Transforming products data to staging")
-    load_staging_products_from_raw(raw_table_name)
+        # Transform to staging
+        logging.info("Transforming products data to staging")
+        load_staging_products_from_raw(raw_table_name)
 
-    # Promote to production
-    logging.info("Promoting products data to production")
-    load_prod_products_from_staging()
+        # Promote to production
+        logging.info("Promoting products data to production")
+        load_prod_products_from_staging()
 
     # Step 5: Configure search functionality
     logging.info("Step 5: Configuring products search functionality")
@@ -1,16 +1,24 @@
 from mitmproxy import http
+import asyncio
 import os
 
 
-def response(flow: http.HTTPFlow) -> None:
-    # Filter only Carrefour and HTML responses
-    if (
-        "carrefour.es" in flow.request.pretty_url
-        and "text/html" in flow.response.headers.get("content-type", "")
-    ):
-        url = flow.request.pretty_url.replace("https://", "").replace("/", "_")
-        filename = f"{url[:100]}.html"  # cut to avoid too long filenames
-        os.makedirs("raw_data", exist_ok=True)
-        with open(filename, "wb") as f:
-            f.write(flow.response.content)
-        print(f"[+] Saved: {filename}")
+def _save(filename: str, content: bytes) -> None:
+    os.makedirs("raw_data", exist_ok=True)
+    with open(filename, "wb") as f:
+        f.write(content)
+
+
+async def response(flow: http.HTTPFlow) -> None:
+    # Filter only HTML responses from Carrefour, checking the header and host
+    # before the body is touched so other traffic is never read into memory
+    if not flow.response.headers.get("content-type", "").startswith("text/html"):
+        return
+    if "carrefour.es" not in flow.request.host:
+        return
+
+    url = flow.request.pretty_url.replace("https://", "").replace("/", "_")
+    filename = f"{url[:100]}.html"  # cut to avoid too long filenames
+    # Write off the event loop so saving a page doesn't stall other flows
+    await asyncio.to_thread(_save, filename, flow.response.content)
+    print(f"[+] Saved: {filename}")
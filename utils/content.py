@@ -1,15 +1,101 @@
 from urllib.parse import urlencode
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+import os
 import time
 import logging
-from bs4 import BeautifulSoup
-import sys
-from os.path import dirname, abspath
+import threading
+from collections import deque
+import zstandard as zstd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Add the parent directory to the sys.path
-sys.path.append(dirname(dirname(abspath(__file__))))
+from utils.redis import redis_conn, hash_md5, hash_xxh3
 
-from utils.redis import redis_conn, hash_md5
+_HTTP_SESSION = None
+
+# Cached HTML is stored zstd-compressed; entries without an 'enc' field are plain
+_CACHE_ENCODING = "zstd"
+_ZSTD_LEVEL = 3
+
+# Entries younger than HTML_CACHE_MAX_AGE are served without touching the network;
+# older ones are revalidated with a conditional GET. Redis drops entries after
+# HTML_CACHE_TTL seconds. Both are in seconds.
+HTML_CACHE_MAX_AGE = int(os.getenv("HTML_CACHE_MAX_AGE", "3600"))
+_CACHE_TTL = int(os.getenv("HTML_CACHE_TTL", "86400"))
+
+# Entries written before keys moved to XXH3 live under the MD5 of the URL and
+# are migrated on lookup. Set HTML_CACHE_MIGRATE_MD5_KEYS=0 once none are left
+# (MD5 entries written with a TTL expire on their own); the check then goes away
+_MIGRATE_MD5_KEYS = os.getenv("HTML_CACHE_MIGRATE_MD5_KEYS", "1") == "1"
+
+# Process-wide cap on outgoing requests, shared by every fetching thread
+_MAX_REQUESTS_PER_SECOND = int(os.getenv("HTTP_MAX_REQUESTS_PER_SECOND", "2"))
+if _MAX_REQUESTS_PER_SECOND < 1:
+    raise ValueError(
+        "HTTP_MAX_REQUESTS_PER_SECOND must be at least 1, "
+        f"got {_MAX_REQUESTS_PER_SECOND}"
+    )
+_REQUEST_TIMES = deque()
+_REQUEST_TIMES_LOCK = threading.Lock()
+
+# Retried inside urllib3 with exponential backoff, capped at 30s and jittered so
+# concurrent fetches don't retry in lockstep; honours Retry-After on 429/503
+_HTTP_RETRY = Retry(
+    total=5,
+    backoff_factor=1.0,
+    backoff_max=30,
+    backoff_jitter=1.0,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(["GET"]),
+)
+
+
+def http_session() -> requests.Session:
+    """
+    Returns the shared HTTP session used for every outgoing request.
+
+    The session is created lazily on first use and kept for the lifetime of the
+    process, so keep-alive connections are reused across retries and across the
+    category and grid fetches instead of paying a new TCP+TLS handshake each time.
+    Connection errors, timeouts and retryable status codes (429 and 5xx) are
+    retried by the mounted adapter with exponential backoff.
+
+    Returns:
+    requests.Session: The shared HTTP session.
+    """
+    global _HTTP_SESSION
+    if _HTTP_SESSION is None:
+        session = requests.Session()
+        # pool_block makes threads beyond pool_maxsize wait for a pooled connection
+        # instead of opening a throwaway one that is discarded after a single use
+        adapter = HTTPAdapter(
+            max_retries=_HTTP_RETRY,
+            pool_connections=32,
+            pool_maxsize=64,
+            pool_block=True,
+        )
+        session.mount("https://", adapter)
+        _HTTP_SESSION = session
+    return _HTTP_SESSION
+
+
+def _wait_for_rate_limit() -> None:
+    """
+    Blocks until one more request fits within HTTP_MAX_REQUESTS_PER_SECOND.
+
+    Start times of the requests sent during the last second are kept in a sliding
+    window shared by all threads, so concurrent fetches are throttled together
+    and no time is spent sleeping while the server is below the limit.
+    """
+    with _REQUEST_TIMES_LOCK:
+        now = time.monotonic()
+        while _REQUEST_TIMES and now - _REQUEST_TIMES[0] >= 1.0:
+            _REQUEST_TIMES.popleft()
+        if len(_REQUEST_TIMES) >= _MAX_REQUESTS_PER_SECOND:
+            time.sleep(1.0 - (now - _REQUEST_TIMES.popleft()))
+            now = time.monotonic()
+        _REQUEST_TIMES.append(now)
 
 
 def _build_full_url(url: str, params: dict | None) -> str:
@@ -24,87 +110,248 @@ def _build_full_url(url: str, params: dict | None) -> str:
     return f"{url}?{query}"
 
 
-def fetch_html_content(url, params=None, retries=5, timeout=5, delay=5):
+def _encode_html(html: str) -> bytes:
+    """
+    Compresses HTML for storage in the Redis cache.
+
+    A fresh compressor is used per call because zstd contexts must not be shared
+    between the threads that fetch grid chunks concurrently.
+    """
+    return zstd.ZstdCompressor(level=_ZSTD_LEVEL).compress(html.encode("utf-8"))
+
+
+def _decode_html(cached: dict) -> str | None:
+    """
+    Returns the HTML stored in a cached entry, decompressing it if it was
+    written with an encoding. Entries written before compression was enabled
+    carry no 'enc' field and are returned as-is.
+    """
+    html_bytes = cached.get(b"html")
+    if not html_bytes:
+        return None
+    if cached.get(b"enc") == _CACHE_ENCODING.encode():
+        html_bytes = zstd.ZstdDecompressor().decompress(html_bytes)
+    return html_bytes.decode("utf-8")
+
+
+def _read_cache(full_urls: list[str]) -> list[dict]:
+    """
+    Reads the cache entries of several URLs in a single Redis round trip.
+
+    HGETALL returns an empty hash on a miss, so no separate EXISTS is needed. The
+    legacy MD5 key of every URL is checked in the same pipeline (unless
+    HTML_CACHE_MIGRATE_MD5_KEYS is off): misses that still have an entry written
+    before keys moved to XXH3 get it renamed to the new key and read back, all in
+    one more pipeline, so they are revalidated instead of refetched.
+
+    Parameters:
+    full_urls (list[str]): Fully-qualified URLs (see `_build_full_url`).
+
+    Returns:
+    list[dict]: The raw cache hash of each URL, in order ({} on a miss).
+    """
+    conn = redis_conn()
+    redis_keys = [f"urls:{hash_xxh3(full_url)}" for full_url in full_urls]
+    pipe = conn.pipeline(transaction=False)
+    for full_url, redis_key in zip(full_urls, redis_keys):
+        pipe.hgetall(redis_key)
+        if _MIGRATE_MD5_KEYS:
+            pipe.exists(f"urls:{hash_md5(full_url)}")
+    results = pipe.execute()
+    if not _MIGRATE_MD5_KEYS:
+        return results
+
+    cached_entries = results[0::2]
+    legacy = [
+        i
+        for i, (cached, has_legacy) in enumerate(zip(cached_entries, results[1::2]))
+        if not cached and has_legacy
+    ]
+    if not legacy:
+        return cached_entries
+
+    # RENAMENX leaves a key written meanwhile in place, and errors (returned, not
+    # raised) when another process migrated the legacy key first; either way the
+    # HGETALL that follows reads whatever now lives under the new key
+    pipe = conn.pipeline(transaction=False)
+    for i in legacy:
+        pipe.renamenx(f"urls:{hash_md5(full_urls[i])}", redis_keys[i])
+        pipe.hgetall(redis_keys[i])
+    results = pipe.execute(raise_on_error=False)
+    for i, cached in zip(legacy, results[1::2]):
+        cached_entries[i] = cached if isinstance(cached, dict) else {}
+    return cached_entries
+
+
+def _write_cache(entries: list[tuple[str, dict]]) -> None:
+    """
+    Writes cache fields for several URLs in a single pipelined Redis round trip,
+    refreshing the expiry of every entry written.
+
+    Parameters:
+    entries (list[tuple[str, dict]]): (fully-qualified URL, fields to set) pairs.
+    """
+    if not entries:
+        return
+    pipe = redis_conn().pipeline(transaction=False)
+    for full_url, fields in entries:
+        redis_key = f"urls:{hash_xxh3(full_url)}"
+        pipe.hset(redis_key, mapping=fields)
+        pipe.expire(redis_key, _CACHE_TTL)
+    pipe.execute()
+
+
+def _fetch_page(url, params, full_url, cached, timeout):
+    """
+    Returns the HTML of a page given its cache entry, hitting the network only when
+    the entry is missing or stale. See `fetch_html_content` for the caching rules.
+
+    Nothing is written to Redis here: the fields to store for the page are returned
+    next to the HTML (None on a fresh cache hit) so callers can batch the writes
+    with `_write_cache`.
+    """
+    cached_html = _decode_html(cached) if cached else None
+    headers = {}
+    if cached_html:
+        fetched_at = float(cached.get(b"fetched_at", 0))
+        # Fresh cache hit: return stored HTML immediately
+        if time.time() - fetched_at < HTML_CACHE_MAX_AGE:
+            logging.info("Cache hit for %s", full_url)
+            return cached_html, None
+        # Stale: ask the server whether the page changed since we stored it
+        if cached.get(b"etag"):
+            headers["If-None-Match"] = cached[b"etag"].decode("utf-8")
+        if cached.get(b"last_modified"):
+            headers["If-Modified-Since"] = cached[b"last_modified"].decode("utf-8")
+
+    logging.info("Fetching HTML content from %s", full_url)
+
+    _wait_for_rate_limit()
+    try:
+        response = http_session().get(
+            url, params=params, headers=headers, timeout=timeout
+        )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logging.error("Max retries reached. Failed to access page: %s", e)
+        raise RuntimeError("Max retries reached. Failed to access page.") from e
+
+    if response.status_code == 304 and cached_html:
+        logging.info("Not modified, reusing cached HTML for %s", full_url)
+        return cached_html, {"fetched_at": time.time()}
+
+    # Cached as served: every caller re-parses it, so prettifying is wasted work
+    html = response.text
+    logging.info("Fetched HTML content from %s", full_url)
+
+    # Entry to store in Redis (collection 'urls')
+    return html, {
+        "url": full_url,
+        "html": _encode_html(html),
+        "enc": _CACHE_ENCODING,
+        "etag": response.headers.get("ETag", ""),
+        "last_modified": response.headers.get("Last-Modified", ""),
+        "fetched_at": time.time(),
+    }
+
+
+def fetch_html_content(url, params=None, timeout=5):
     """
-    Fetches HTML content from the specified URL using the requests library.
-    If the request fails due to a timeout or other request exception,
-    it will retry the specified number of times.
+    Fetches HTML content from the specified URL using the shared HTTP session.
+    Failed requests are retried by the session adapter (see `http_session`).
 
     The response is cached in Redis under the 'urls' collection using a key
-    derived from the MD5 hash of the fully-qualified URL (including querystring).
-    Subsequent calls with the same URL+params return the cached HTML.
+    derived from the XXH3 hash of the fully-qualified URL (including querystring).
+    The HTML is stored zstd-compressed, with the encoding recorded in 'enc', next
+    to the server's ETag / Last-Modified validators and the fetch timestamp.
+
+    Cached entries younger than HTML_CACHE_MAX_AGE are returned directly. Older
+    entries are revalidated with If-None-Match / If-Modified-Since, so a 304 from
+    the server refreshes the entry without downloading the page again. Entries
+    expire from Redis after HTML_CACHE_TTL seconds.
+
+    Requests are throttled process-wide to HTTP_MAX_REQUESTS_PER_SECOND (see
+    `_wait_for_rate_limit`); 429 responses are retried after their Retry-After.
 
     Parameters:
     url (str): The URL to fetch the HTML content from.
     params (dict, optional): Additional parameters to be sent with the request. Defaults to None.
-    retries (int, optional): The number of times to retry the request in case of failure.
-                             Defaults to 5.
     timeout (int, optional): The timeout for the request in seconds. Defaults to 5.
-    delay (int, optional): The delay between retries in seconds. Defaults to 5.
 
     Returns:
-    str: The prettified HTML content of the fetched page (from cache if available).
+    str: The HTML content of the fetched page as served (from cache if available).
 
     Raises:
-    RuntimeError: If the maximum number of retries is reached without successful response.
+    RuntimeError: If the page could not be fetched once all retries are exhausted.
     """
     if params is None:
         params = {}
 
     full_url = _build_full_url(url, params)
-    redis_key = f"urls:{hash_md5(full_url)}"
+    (cached,) = _read_cache([full_url])
+    html, fields = _fetch_page(url, params, full_url, cached, timeout)
+    if fields:
+        _write_cache([(full_url, fields)])
+    return html
 
-    # Cache hit: return stored HTML immediately
-    if redis_conn().exists(redis_key):
-        cached = redis_conn().hgetall(redis_key)
-        html_bytes = cached.get(b"html")
-        if html_bytes:
-            logging.info("Cache hit for %s", full_url)
-            return html_bytes.decode("utf-8")
 
-    logging.info("Fetching HTML content from %s", full_url)
+def fetch_html_contents(url, params_list, timeout=5, max_workers=8):
+    """
+    Fetches the same URL with several sets of parameters, e.g. every page of a
+    paginated listing, with the caching rules of `fetch_html_content`.
 
-    for attempt in range(0, retries):
-        try:
-            response = requests.get(url, params=params, timeout=timeout)
-            response.raise_for_status()
-
-            bs = BeautifulSoup(response.content, "html.parser")
-            html_pretty = bs.prettify()
-
-            # Be respectful to the server
-            time.sleep(delay)
-            logging.info("Fetched HTML content from %s", full_url)
-
-            # Store in Redis (collection 'urls')
-            redis_conn().hset(
-                redis_key,
-                mapping={
-                    "url": full_url,
-                    "html": html_pretty,
-                },
-            )
-
-            return html_pretty
-
-        except requests.Timeout as e:
-            logging.error("Timeout accessing page: %s", e)
-            logging.warning(
-                "Attempt %d/%d failed due to timeout. Retrying...", attempt + 1, retries
-            )
-            logging.warning("Sleeping for %d seconds...", delay * (attempt + 1))
-            time.sleep(delay * (attempt + 1))
-
-        except requests.RequestException as e:
-            logging.error("Error accessing page: %s", e)
-            logging.warning("Attempt %d/%d failed. Retrying...", attempt + 1, retries)
+    All cache entries are read in one pipelined Redis round trip up front, and the
+    pages that are missing or stale are then fetched concurrently, within the
+    shared request rate limit. On the first failure the pages not started yet are
+    cancelled, so an outage doesn't wait out the retries of every page. The
+    resulting cache writes are flushed in one pipeline once the fetches have
+    finished, including the pages fetched before a failure, so a retry does not
+    download them again.
 
-        except Exception as e:
-            logging.error("An unexpected error occurred: %s", e)
-            raise RuntimeError(f"An unexpected error occurred: {e}") from e
+    Parameters:
+    url (str): The URL to fetch the HTML content from.
+    params_list (list[dict]): One set of request parameters per page.
+    timeout (int, optional): The timeout for each request in seconds. Defaults to 5.
+    max_workers (int, optional): The number of pages fetched concurrently. Defaults to 8.
+
+    Returns:
+    list[str]: The HTML content of each page, in the order of `params_list`.
 
-        logging.warning("Sleeping for %d seconds...", delay * (attempt + 1))
-        time.sleep(delay * (attempt + 1))
+    Raises:
+    RuntimeError: If a page could not be fetched once all retries are exhausted.
+    """
+    full_urls = [_build_full_url(url, params) for params in params_list]
+    cached_entries = _read_cache(full_urls)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_fetch_page, url, params, full_url, cached, timeout)
+            for params, full_url, cached in zip(params_list, full_urls, cached_entries)
+        ]
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                # The pages still queued would most likely fail the same way (e.g.
+                # the site is down), each through every retry: don't start them.
+                # Pages already in flight are still waited for
+                executor.shutdown(wait=False, cancel_futures=True)
+                break
+
+    pages = []
+    pending_writes = []
+    error = None
+    for full_url, future in zip(full_urls, futures):
+        if future.cancelled():
+            continue
+        try:
+            html, fields = future.result()
+        except Exception as e:
+            error = error or e
+            continue
+        pages.append(html)
+        if fields:
+            pending_writes.append((full_url, fields))
 
-    logging.error("Max retries reached. Failed to access page.")
-    raise RuntimeError("Max retries reached. Failed to access page.")
+    _write_cache(pending_writes)
+    if error:
+        raise error
+    return pages
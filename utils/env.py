@@ -0,0 +1,18 @@
+# pylint: disable=C0114
+from functools import cache
+from dotenv import load_dotenv
+
+
+@cache
+def load_env() -> None:
+    """
+    Loads environment variables from the .env file into os.environ.
+
+    Every utils module that reads settings calls this at import; the .env file is
+    looked up and parsed only on the first call of the process. Variables already
+    set in the environment take precedence over the file.
+
+    Returns:
+        None
+    """
+    load_dotenv()
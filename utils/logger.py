@@ -1,19 +1,42 @@
 # pylint: disable=C0114
+import atexit
 import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# pylint: disable=W0603
+_LOG_LISTENER = None
 
 
 def configure_logging(debug_mode: bool) -> None:
     """
     Configures logging based on the provided debug_mode.
+
+    Records are put on an in-memory queue by the root logger and written to
+    stderr by a background listener thread, so callers never block on
+    formatting or I/O. The listener is stopped (and the queue flushed) at exit.
     Parameters:
         debug_mode (bool): Whether to enable debug logging.
     Returns:
         None
     """
+    global _LOG_LISTENER
     log_level = logging.DEBUG if debug_mode else logging.INFO
-    logging.basicConfig(
-        level=log_level,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        encoding="utf-8",
+    root = logging.getLogger()
+    root.setLevel(log_level)
+    if _LOG_LISTENER is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(
+        logging.Formatter(
+            "%(asctime)s - %(levelname)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+        )
     )
+    log_queue = queue.Queue(-1)
+    root.addHandler(QueueHandler(log_queue))
+
+    _LOG_LISTENER = QueueListener(log_queue, stream_handler)
+    _LOG_LISTENER.start()
+    atexit.register(_LOG_LISTENER.stop)
@@ -1,20 +1,34 @@
 # pylint: disable=C0114
+import io
+import logging
 import os
-from dotenv import load_dotenv
-from psycopg2.extras import RealDictCursor
-from psycopg2.pool import SimpleConnectionPool
+import struct
+import threading
+from contextlib import contextmanager
+from functools import cache
+from psycopg2 import errors
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from utils.env import load_env
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 # pylint: disable=W0603
 _POSTGRES_POOL = None
 
+# Connection pinned to the current thread by `session()`, if any
+_SESSION = threading.local()
+
 
+@cache
 def get_postgres_config():
     """
     Get PostgreSQL configuration from environment variables with defaults.
 
+    Read once per process: a pool rebuilt after `close_pool()` reuses it.
+
     Returns:
         dict: Configuration dictionary for PostgreSQL connection
     """
@@ -24,8 +38,8 @@ def get_postgres_config():
         "database": os.getenv("POSTGRES_DB", "optimal"),
         "user": os.getenv("POSTGRES_USER", "data_ingestor"),
         "password": os.getenv("POSTGRES_PASSWORD", "di_supersecret"),
-        "minconn": int(os.getenv("POSTGRES_MIN_CONN", "1")),
-        "maxconn": int(os.getenv("POSTGRES_MAX_CONN", "10")),
+        "minconn": int(os.getenv("POSTGRES_MIN_CONN", "5")),
+        "maxconn": int(os.getenv("POSTGRES_MAX_CONN", "25")),
     }
 
 
@@ -33,13 +47,16 @@ def get_postgres_pool():
     """
     Get or create a PostgreSQL connection pool.
 
+    The pool is thread-safe, so the concurrent extract/load steps can share it,
+    and stays warm for the whole CLI invocation until `close_pool()` drains it.
+
     Returns:
-        SimpleConnectionPool: PostgreSQL connection pool
+        ThreadedConnectionPool: PostgreSQL connection pool
     """
     global _POSTGRES_POOL
     if _POSTGRES_POOL is None:
         config = get_postgres_config()
-        _POSTGRES_POOL = SimpleConnectionPool(
+        _POSTGRES_POOL = ThreadedConnectionPool(
             minconn=config["minconn"],
             maxconn=config["maxconn"],
             host=config["host"],
@@ -73,6 +90,68 @@ def return_postgres_connection(conn):
     pool.putconn(conn)
 
 
+@contextmanager
+def connection():
+    """
+    Borrow a connection from the pool for the duration of a block.
+
+    The connection is always returned to the pool, even if the block raises;
+    committing or rolling back is up to the caller. Inside a `session()` the
+    session's connection is used instead, and stays checked out.
+
+    Yields:
+        PostgreSQL connection object
+    """
+    if in_session():
+        yield _SESSION.conn
+        return
+
+    conn = get_postgres_connection()
+    try:
+        yield conn
+    finally:
+        return_postgres_connection(conn)
+
+
+def in_session():
+    """
+    Whether the current thread is running inside a `session()` block.
+
+    Returns:
+        True if queries are pinned to a session connection, False otherwise
+    """
+    return getattr(_SESSION, "conn", None) is not None
+
+
+@contextmanager
+def session():
+    """
+    Run every query of a block on one pooled connection, as one transaction.
+
+    `execute_query`, `transaction()` and `connection()` calls made by the
+    current thread inside the block reuse the session's connection and leave
+    committing to the session: it commits when the block exits normally and
+    rolls back if it raises. Nested sessions join the outermost one.
+
+    Yields:
+        PostgreSQL connection object
+    """
+    if in_session():
+        yield _SESSION.conn
+        return
+
+    with connection() as conn:
+        _SESSION.conn = conn
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            _SESSION.conn = None
+
+
 def execute_query(query, params=None, fetch=True):
     """
     Execute a SQL query with proper connection management.
@@ -83,31 +162,165 @@ def execute_query(query, params=None, fetch=True):
         fetch: Whether to fetch results (True for SELECT, False for INSERT/UPDATE/DELETE)
 
     Returns:
-        Query results if fetch=True, None otherwise
+        Query results if fetch=True (a list of RealDictRow, i.e. dicts keyed by
+        column name), None otherwise
     """
-    conn = None
-    try:
-        conn = get_postgres_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(query, params)
-
-            if fetch:
-                # Check if there are results to fetch (e.g., for SELECT statements)
-                if cursor.description:
-                    result = cursor.fetchall()
-                    return [dict(row) for row in result]
-                return None  # No results to fetch (e.g., for DDL/DML statements without RETURNING)
-            else:
-                conn.commit()
-                return None
+    with connection() as conn:
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query, params)
+
+                if fetch:
+                    # Check if there are results to fetch (e.g., for SELECT statements)
+                    if cursor.description:
+                        # RealDictRow is already a dict subclass: no need to copy
+                        return cursor.fetchall()
+                    return None  # No results to fetch (e.g., for DDL/DML statements without RETURNING)
+                else:
+                    # A session commits once, when it ends
+                    if not in_session():
+                        conn.commit()
+                    return None
+
+        except Exception as e:
+            if not in_session():
+                conn.rollback()
+            raise e
+
+
+@contextmanager
+def transaction():
+    """
+    Run several statements on one pooled connection as a single transaction.
 
-    except Exception as e:
-        if conn:
+    Yields a cursor; the transaction is committed when the block exits normally
+    and rolled back if it raises. The connection is returned to the pool either way.
+    Inside a `session()` the block is part of the session's transaction instead.
+
+    Yields:
+        psycopg2 cursor bound to the transaction's connection
+    """
+    if in_session():
+        # Part of the session's transaction, which commits or rolls back
+        with _SESSION.conn.cursor() as cursor:
+            yield cursor
+        return
+
+    with connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                yield cursor
+            conn.commit()
+        except Exception:
             conn.rollback()
-        raise e
-    finally:
-        if conn:
-            return_postgres_connection(conn)
+            raise
+
+
+# PGCOPY binary signature, flags field and header extension length
+_COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_BINARY_NULL = struct.pack("!i", -1)
+_COPY_BINARY_TRAILER = struct.pack("!h", -1)
+# Length prefix and value of a float8 / int8 field
+_COPY_BINARY_FLOAT8 = struct.Struct("!id")
+_COPY_BINARY_INT8 = struct.Struct("!iq")
+
+
+def copy_rows_binary(cursor, table_name, columns, rows):
+    """
+    Bulk load rows into TEXT, DOUBLE PRECISION and BIGINT columns with COPY FROM
+    STDIN (binary format).
+
+    Binary COPY sends every value as a length-prefixed byte string, so neither
+    side has to escape or lex the data. Floats are sent as 8-byte IEEE doubles
+    and ints as 8-byte integers, the binary representations of DOUBLE PRECISION
+    and BIGINT; every other value is encoded as UTF-8 text, the binary
+    representation of TEXT/VARCHAR. Use `insert_rows` for tables with other
+    column types.
+
+    Parameters:
+        cursor: Cursor to run the COPY on (e.g. from `transaction()`)
+        table_name: Schema-qualified target table
+        columns: Column names, in the order of the values in each row
+        rows: Iterable of row tuples; floats go to DOUBLE PRECISION columns, ints
+            to BIGINT columns, other values are written with str() to TEXT
+            columns, None as NULL
+    """
+    field_count = struct.pack("!h", len(columns))
+    buffer = io.BytesIO()
+    buffer.write(_COPY_BINARY_HEADER)
+    for row in rows:
+        buffer.write(field_count)
+        for value in row:
+            if value is None:
+                buffer.write(_COPY_BINARY_NULL)
+            elif isinstance(value, float):
+                buffer.write(_COPY_BINARY_FLOAT8.pack(8, value))
+            elif isinstance(value, int) and not isinstance(value, bool):
+                buffer.write(_COPY_BINARY_INT8.pack(8, value))
+            else:
+                data = str(value).encode("utf-8")
+                buffer.write(struct.pack("!i", len(data)))
+                buffer.write(data)
+    buffer.write(_COPY_BINARY_TRAILER)
+    buffer.seek(0)
+
+    column_names = ", ".join(f'"{col}"' for col in columns)
+    cursor.copy_expert(
+        f"COPY {table_name} ({column_names}) FROM STDIN WITH (FORMAT binary)", buffer
+    )
+
+
+def insert_rows(cursor, table_name, columns, rows, page_size=1000):
+    """
+    Bulk insert rows with multi-row INSERT ... VALUES statements.
+
+    Slower than COPY, but only needs INSERT privileges: each statement carries
+    `page_size` rows, so there is one parse and one round trip per page
+    instead of per row.
+
+    Parameters:
+        cursor: Cursor to run the INSERTs on (e.g. from `transaction()`)
+        table_name: Schema-qualified target table
+        columns: Column names, in the order of the values in each row
+        rows: Iterable of row tuples
+        page_size: Number of rows per INSERT statement
+    """
+    column_names = ", ".join(f'"{col}"' for col in columns)
+    execute_values(
+        cursor,
+        f"INSERT INTO {table_name} ({column_names}) VALUES %s",
+        rows,
+        page_size=page_size,
+    )
+
+
+def load_rows(cursor, table_name, columns, rows):
+    """
+    Bulk load rows into TEXT, DOUBLE PRECISION and BIGINT columns, with COPY if
+    the server allows it.
+
+    The binary COPY runs under a savepoint; if the role may not COPY (e.g. on
+    a managed PostgreSQL), the savepoint is rolled back and the rows are
+    loaded with batched INSERTs instead, in the same transaction.
+
+    Parameters:
+        cursor: Cursor to run the load on (e.g. from `transaction()`)
+        table_name: Schema-qualified target table, as for `copy_rows_binary`
+        columns: Column names, in the order of the values in each row
+        rows: Sequence of row tuples; it may be read twice, so not an iterator
+    """
+    cursor.execute("SAVEPOINT load_rows")
+    try:
+        copy_rows_binary(cursor, table_name, columns, rows)
+    except (errors.InsufficientPrivilege, errors.FeatureNotSupported) as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT load_rows")
+        logging.warning(
+            "COPY into %s not available (%s), falling back to batched INSERT",
+            table_name,
+            str(e).strip(),
+        )
+        insert_rows(cursor, table_name, columns, rows)
+    cursor.execute("RELEASE SAVEPOINT load_rows")
 
 
 def test_connection():
@@ -128,11 +341,39 @@ def test_connection():
         return False
 
 
+# Bump whenever the search setup in `configure_products_search` changes, so the
+# next deploy re-runs it
+_PRODUCTS_SEARCH_VERSION = 1
+
+# Arbitrary key of the advisory lock serialising concurrent search setups
+_PRODUCTS_SEARCH_LOCK = 871234
+
+
 def configure_products_search():
     """
     Configure full-text search functionality for products table.
     This function sets up the search configuration, creates the search column,
     and creates the search function for products.
+
+    Rebuilding the search column rewrites prod.products under an exclusive lock,
+    so the setup only runs when the version recorded in prod.schema_version is
+    older than _PRODUCTS_SEARCH_VERSION, or the search index is missing (e.g. the
+    table was recreated). An advisory lock keeps two pipelines from running it
+    at the same time.
+    """
+    guard_sql = f"""
+    CREATE SCHEMA IF NOT EXISTS prod;
+    CREATE TABLE IF NOT EXISTS prod.schema_version (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+    SELECT pg_advisory_xact_lock({_PRODUCTS_SEARCH_LOCK});
+    SELECT
+        COALESCE(
+            (SELECT version FROM prod.schema_version WHERE name = 'products_search'),
+            0
+        ) >= {_PRODUCTS_SEARCH_VERSION}
+        AND to_regclass('prod.idx_prod_products_search') IS NOT NULL;
     """
     search_config_sql = """
     -- 1) Config mínima por si no está (idempotente)
@@ -171,7 +412,9 @@ def configure_products_search():
       setweight(to_tsvector('prod.es_unaccent', COALESCE(name,'')),        'B')
     ) STORED;
 
-    -- 3) Índice GIN sobre la columna search
+    -- 3) Índice GIN sobre la columna search, construido de una vez sobre los
+    --    datos ya cargados; más memoria de mantenimiento solo para esta transacción
+    SET LOCAL maintenance_work_mem = '512MB';
     CREATE INDEX IF NOT EXISTS idx_prod_products_search
     ON prod.products USING GIN(search);
 
@@ -206,7 +449,23 @@ def configure_products_search():
     $$;
     """
 
-    execute_query(search_config_sql, fetch=False)
+    with transaction() as cursor:
+        # The lock is held until the transaction ends, so a concurrent setup
+        # waits here and then sees this one's version
+        cursor.execute(guard_sql)
+        if cursor.fetchone()[0]:
+            logging.info("Products search is up to date")
+            return
+
+        cursor.execute(search_config_sql)
+        cursor.execute(
+            """
+            INSERT INTO prod.schema_version (name, version)
+            VALUES ('products_search', %s)
+            ON CONFLICT (name) DO UPDATE SET version = EXCLUDED.version;
+            """,
+            (_PRODUCTS_SEARCH_VERSION,),
+        )
 
 
 def close_pool():
@@ -1,10 +1,12 @@
 import hashlib
 import os
-from dotenv import load_dotenv
 import redis
+import xxhash
+
+from utils.env import load_env
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 _REDIS_CONN = None
 
@@ -44,3 +46,19 @@ def hash_md5(data: str) -> str:
     md5_hash = hashlib.md5()
     md5_hash.update(data.encode("utf-8"))
     return md5_hash.hexdigest()
+
+
+def hash_xxh3(data: str) -> str:
+    """
+    Calculates the 128-bit XXH3 hash of the provided data.
+
+    XXH3 is a non-cryptographic hash and much faster than MD5, which makes it the
+    preferred choice for cache keys.
+
+    Parameters:
+    data (str): The input data for which the XXH3 hash needs to be calculated.
+
+    Returns:
+    str: The XXH3-128 hash of the input data in hexadecimal format.
+    """
+    return xxhash.xxh3_128_hexdigest(data.encode("utf-8"))